@@ -7,60 +7,876 @@
 
 import sys
 import os
-import telnetlib
 import re
 import time
-from xml.dom.minidom import parseString
-from threading import Timer
-import StringIO
+import socket
+import select
+import threading
+import json
+import random
+import heapq
+import bisect
+import gzip
+import itertools
+import collections
+import xml.parsers.expat
 from time import strftime
 
+# c-gate reports addresses qualified with the project name, e.g. //PROJECT/254/56/12
+projectAddressPattern = re.compile("\/\/\w+\/([\w|\/]+).*")
+
+# lines of c-gate "tree" output describing units (to determine which are relays and dimmers) and lighting groups
+treeUnitPattern = re.compile("(\/\/\w+)\/.*p\/(\w+).*type\=(\w+).*groups\=(.*)")
+treeGroupPattern = re.compile("\/56\/(\w+).*level\=(\w+).*units\=(.*)")
+# unit type prefixes (from the unit's catalogue number) and the device type they map to
+treeUnitTypes = (("DIM", "cbusDimmer"), ("REL", "cbusRelay"), ("KEY", "cbusSwitch"))
+# a line of the reply to a bulk level query, e.g. 300-//PROJECT/254/56/12: level=255
+levelReplyPattern = re.compile("\d{3}[ -]\/\/\w+\/([\w\/]+): level=(\d+)")
+
+# bump whenever the structure of the cached project model changes so stale caches are ignored
+projectCacheVersion = 1
+
+class MonitorEvent(object):
+	# a single line from the c-gate monitor port, parsed once.  address has the //project prefix removed
+	# (e.g. 254/56/12), numeric fields are ints and any other positional fields are kept in values
+	__slots__ = ("application", "command", "address", "level", "rampTime", "sourceUnit", "measurement", "values")
+
+	def __init__(self, application, command, address):
+		self.application = application
+		self.command = command
+		self.address = address
+		self.level = None
+		self.rampTime = 0
+		self.sourceUnit = None
+		self.measurement = None
+		self.values = []
+
+def parseMonitorLine(line):
+	# returns a MonitorEvent or None if the line is not an application event.  raises ValueError if a
+	# numeric field cannot be parsed
+	if line.startswith("# "):
+		line = line[2:]
+	fields = line.split()
+	if len(fields) < 3:
+		return None
+	m = projectAddressPattern.match(fields[2])
+	if m:
+		event = MonitorEvent(fields[0], fields[1], m.group(1))
+	else:
+		event = MonitorEvent(fields[0], fields[1], fields[2])
+	for field in fields[3:]:
+		if "=" in field:
+			key, value = field.lstrip("#").split("=", 1)
+			if key == "sourceunit":
+				event.sourceUnit = int(value)
+			elif key == "level":
+				event.level = int(value)
+		else:
+			event.values.append(field)
+	if event.application == "lighting":
+		if event.command == "ramp":
+			# lighting ramp <address> <level> <ramp time>
+			event.level = int(event.values[0])
+			event.rampTime = int(event.values[1])
+		elif event.command == "on":
+			event.level = 255
+		elif event.command == "off":
+			event.level = 0
+	elif event.application == "measurement" and event.command == "data":
+		# measurement data <network>/228 <device> <channel> <value> <exponent> [<units>].  the device and channel are
+		# folded into the address (e.g. 254/228/1/0) so a channel is found like any other device address
+		if len(event.address.split("/")) == 2:
+			event.address = event.address+"/"+event.values[0]+"/"+event.values[1]
+			event.values = event.values[2:]
+		event.measurement = int(event.values[0]) * 10 ** int(event.values[1])
+	return event
+
+class TrafficRecorder(object):
+	# writes raw c-gate traffic to a gzip compressed trace, one tab separated line per entry: seconds since the
+	# recording started, the channel (m for the monitor port, c for a command sent, r for a command reply) and the
+	# line itself.  traces are replayed offline with replayTrace, see Tools/replay_trace.py
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.lines = 0
+		self.trace = gzip.open(path, "wb")
+
+	def record(self, channel, line):
+		with self.lock:
+			if self.trace:
+				self.trace.write("%.3f\t%s\t%s\n" % (time.time() - self.started, channel, line))
+				self.lines = self.lines + 1
+
+	def close(self):
+		with self.lock:
+			if self.trace:
+				self.trace.close()
+				self.trace = None
+
+def replayTrace(path, feed, realtime=False):
+	# pass the monitor lines of a trace written by TrafficRecorder to feed(line), either as fast as possible or with
+	# the spacing they were recorded with.  returns the number of lines fed
+	count = 0
+	origin = None
+	with gzip.open(path, "rb") as trace:
+		for entry in trace:
+			fields = entry.rstrip("\r\n").split("\t", 2)
+			if len(fields) < 3 or fields[1] != "m":
+				continue
+			if realtime:
+				offset = float(fields[0])
+				if origin == None:
+					origin = time.time() - offset
+				delay = origin + offset - time.time()
+				if delay > 0:
+					time.sleep(delay)
+			feed(fields[2])
+			count = count + 1
+	return count
+
+class LineSocket(object):
+	# a socket to c-gate which buffers partial reads and only ever hands back complete lines
+
+	def __init__(self, location, port, timeout=10):
+		self.socket = socket.create_connection((location, port), timeout)
+		self.buffer = ""
+
+	def readLines(self, timeout):
+		# returns the complete lines received within timeout seconds. raises EOFError if c-gate closes the socket
+		readable, writable, errors = select.select([self.socket], [], [], timeout)
+		if not readable:
+			return []
+		data = self.socket.recv(65536)
+		if not data:
+			raise EOFError
+		lines = (self.buffer + data).split("\n")
+		self.buffer = lines.pop()
+		return [line.rstrip("\r") for line in lines]
+
+	def write(self, str):
+		self.socket.sendall(str.encode('latin-1'))
+
+	def close(self):
+		try:
+			self.socket.close()
+		except socket.error:
+			pass
+
+class GroupXmlParser(object):
+	# incrementally parses the xml document carried by a dbgetxml reply and hands each <Group> to onGroup as
+	# soon as its closing tag is seen.  only the group currently being parsed is held in memory
+
+	groupFields = ("Address", "OID", "TagName")
+
+	def __init__(self, onGroup):
+		self.onGroup = onGroup
+		self.group = None
+		self.field = None
+		self.text = []
+		self.error = None
+		self.parser = xml.parsers.expat.ParserCreate()
+		self.parser.StartElementHandler = self.startElement
+		self.parser.EndElementHandler = self.endElement
+		self.parser.CharacterDataHandler = self.characters
+
+	def feed(self, data):
+		# errors are kept until close() as feed is called from the command session's reader thread
+		if self.error == None:
+			try:
+				self.parser.Parse(data, False)
+			except xml.parsers.expat.ExpatError as error:
+				self.error = error
+
+	def close(self):
+		if self.error == None:
+			self.parser.Parse("", True)
+		else:
+			raise self.error
+
+	def startElement(self, name, attributes):
+		if name == "Group":
+			self.group = {}
+		elif self.group != None and name in self.groupFields and name not in self.group:
+			self.field = name
+			self.text = []
+
+	def characters(self, data):
+		if self.field:
+			self.text.append(data)
+
+	def endElement(self, name):
+		if name == self.field:
+			self.group[name] = "".join(self.text).strip()
+			self.field = None
+		elif name == "Group":
+			if self.group.get("Address"):
+				self.onGroup(self.group)
+			self.group = None
+
+class Scheduler(object):
+	# runs delayed work (ramp timers, polling, resyncs) on a single thread.  pending calls are kept in a heap ordered
+	# by due time so scheduling is O(log n).  cancelling only marks the call, it is discarded when it reaches the top
+
+	def __init__(self, logger):
+		self.logger = logger
+		self.heap = []
+		self.sequence = itertools.count()
+		self.condition = threading.Condition()
+		self.running = True
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def schedule(self, delay, function, *args):
+		# returns a handle which can be passed to cancel().  the sequence number keeps calls due at the same time in order
+		call = [time.time() + delay, next(self.sequence), function, args, False]
+		with self.condition:
+			heapq.heappush(self.heap, call)
+			if self.heap[0] is call:
+				self.condition.notify()
+		return call
+
+	def cancel(self, call):
+		call[4] = True
+
+	def run(self):
+		while True:
+			with self.condition:
+				while self.running and (not self.heap or self.heap[0][0] > time.time()):
+					if self.heap:
+						self.condition.wait(self.heap[0][0] - time.time())
+					else:
+						self.condition.wait()
+				if not self.running:
+					return
+				due, sequence, function, args, cancelled = heapq.heappop(self.heap)
+			if not cancelled:
+				try:
+					function(*args)
+				except Exception:
+					self.logger.exception("exception occurred whilst running scheduled c-bus task")
+
+	def pending(self):
+		# calls waiting to run.  cancelled calls stay in the heap until they reach the top so they are not counted
+		with self.condition:
+			return len([call for call in self.heap if not call[4]])
+
+	def stop(self):
+		with self.condition:
+			self.running = False
+			self.condition.notify()
+
+class Histogram(object):
+	# a fixed-bucket histogram of durations.  recording a sample is a bisect and a few additions so it is cheap
+	# enough to leave on permanently
+	bounds = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+	def __init__(self):
+		self.buckets = [0] * (len(self.bounds) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def record(self, seconds):
+		self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+		self.count += 1
+		self.total += seconds
+		self.max = max(self.max, seconds)
+
+	def percentile(self, fraction):
+		# the upper bound of the bucket holding the given fraction of samples, limited to the largest sample seen
+		threshold = fraction * self.count
+		seen = 0
+		for index, count in enumerate(self.buckets):
+			seen += count
+			if seen >= threshold and count > 0:
+				return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+		return 0.0
+
+	def summary(self):
+		return "%d samples, mean %.1fms, p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms" % (self.count,
+			1000 * self.total / max(self.count, 1), 1000 * self.percentile(0.5), 1000 * self.percentile(0.95),
+			1000 * self.percentile(0.99), 1000 * self.max)
+
+class Metrics(object):
+	# named duration histograms and event counters for the hot paths (command round trips, monitor events,
+	# handler dispatch, device lookup and indigo calls).  rates are relative to the last reset
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			self.histograms = {}
+			self.counters = {}
+			self.started = time.time()
+
+	def record(self, name, seconds):
+		with self.lock:
+			histogram = self.histograms.get(name)
+			if histogram == None:
+				histogram = self.histograms[name] = Histogram()
+			histogram.record(seconds)
+
+	def count(self, name, increment=1):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + increment
+
+	def report(self):
+		with self.lock:
+			elapsed = max(time.time() - self.started, 1)
+			lines = ["%s: %d (%.2f/s)" % (name, count, count / elapsed) for name, count in sorted(self.counters.items())]
+			lines.extend(["%s: %s" % (name, histogram.summary()) for name, histogram in sorted(self.histograms.items())])
+		return ["c-bus performance over the last %d seconds" % (elapsed)] + lines
+
+class EventQueue(object):
+	# the bounded queue of (key, handler, args) entries in front of one dispatcher worker.  the newest mergeable entry
+	# for each key is remembered so that whilst the queue is full it can be replaced by a later event for the same key
+
+	def __init__(self, depth):
+		self.depth = depth
+		self.entries = collections.deque()
+		self.latest = {}
+		self.condition = threading.Condition()
+
+	def put(self, key, handler, args, mergeable):
+		# returns (merged, seconds spent waiting for room)
+		with self.condition:
+			waited = 0
+			if len(self.entries) >= self.depth:
+				entry = self.latest.get(key) if mergeable else None
+				if entry:
+					# only the latest state of the key matters so the queued entry takes the new event's place
+					entry[1] = handler
+					entry[2] = args
+					return (True, 0)
+				started = time.time()
+				while len(self.entries) >= self.depth:
+					self.condition.wait()
+				waited = time.time() - started
+			entry = [key, handler, args]
+			self.entries.append(entry)
+			if mergeable:
+				self.latest[key] = entry
+			else:
+				# a later entry which can't be merged must not be overtaken
+				self.latest.pop(key, None)
+			self.condition.notify_all()
+			return (False, waited)
+
+	def get(self):
+		with self.condition:
+			while not self.entries:
+				self.condition.wait()
+			entry = self.entries.popleft()
+			if entry[0] != None and self.latest.get(entry[0]) is entry:
+				del self.latest[entry[0]]
+			self.condition.notify_all()
+			return entry
+
+	def stop(self):
+		# queued regardless of depth.  a key of None tells the worker to finish
+		with self.condition:
+			self.entries.append([None, None, None])
+			self.condition.notify_all()
+
+	def __len__(self):
+		return len(self.entries)
+
+class EventDispatcher(object):
+	# runs monitor event handlers on a pool of worker threads so the monitor reader doesn't wait on indigo.  events
+	# for the same address always go to the same worker, so each address is handled in the order events arrived
+	# while different addresses are handled in parallel.  events are never dropped: when a worker falls too far behind
+	# a mergeable event replaces the one still queued for its address, otherwise the caller waits for room
+
+	def __init__(self, workers, depth, logger, metrics=None):
+		self.logger = logger
+		# if provided the time taken by each handler is recorded against its name
+		self.metrics = metrics
+		self.queues = [EventQueue(depth) for index in range(workers)]
+		self.lock = threading.Lock()
+		self.dispatched = 0
+		self.handled = 0
+		self.merged = 0
+		self.blocked = 0
+		self.maxDepth = 0
+		for queue in self.queues:
+			worker = threading.Thread(target=self.work, args=(queue,))
+			worker.daemon = True
+			worker.start()
+
+	def dispatch(self, key, handler, *args):
+		self.put(key, handler, args, False)
+
+	def dispatchLatest(self, key, handler, *args):
+		# for events which only set the state of key.  under backpressure only the latest one for the key is handled
+		self.put(key, handler, args, True)
+
+	def put(self, key, handler, args, mergeable):
+		queue = self.queues[hash(key) % len(self.queues)]
+		merged, waited = queue.put(key, handler, args, mergeable)
+		with self.lock:
+			self.dispatched = self.dispatched + 1
+			if merged:
+				self.merged = self.merged + 1
+			elif waited:
+				self.blocked = self.blocked + 1
+			self.maxDepth = max(self.maxDepth, len(queue))
+		if waited and self.metrics:
+			self.metrics.record("dispatch backpressure", waited)
+
+	def work(self, queue):
+		while True:
+			key, handler, args = queue.get()
+			if handler == None:
+				return
+			started = time.time()
+			try:
+				handler(*args)
+			except Exception:
+				self.logger.exception("exception occurred whilst handling c-bus event")
+			with self.lock:
+				self.handled = self.handled + 1
+			if self.metrics:
+				self.metrics.record("dispatch "+handler.__name__, time.time() - started)
+
+	def depth(self):
+		return sum([len(queue) for queue in self.queues])
+
+	def stats(self):
+		with self.lock:
+			return {'depth': self.depth(), 'maxDepth': self.maxDepth, 'dispatched': self.dispatched, 'handled': self.handled,
+				'merged': self.merged, 'blocked': self.blocked}
+
+	def stop(self):
+		for queue in self.queues:
+			queue.stop()
+
+class CommandResult(object):
+	# the reply to a single command sent to c-gate. callers either wait() for the reply or provide a
+	# callback which is run on the session's reader thread once the reply is complete (or has failed)
+
+	def __init__(self, command, callback=None, lineCallback=None):
+		self.command = command
+		self.callback = callback
+		# if provided each line of the reply is passed to lineCallback as it arrives rather than kept in lines
+		self.lineCallback = lineCallback
+		self.lines = []
+		self.code = None
+		self.deadline = 0
+		self.sent = time.time()
+		self.completed = threading.Event()
+
+	@property
+	def ok(self):
+		# 1xx-3xx responses are informational/successful, 4xx and 5xx are errors. no code means no reply
+		return self.code != None and self.code < 400
+
+	@property
+	def text(self):
+		return "\n".join(self.lines)
+
+	def wait(self, timeout=None):
+		self.completed.wait(timeout)
+		return self.ok
+
+	def complete(self, logger):
+		self.completed.set()
+		if self.callback:
+			try:
+				self.callback(self)
+			except Exception:
+				logger.exception("error handling reply to \"%s\"" % (self.command))
+
+class CommandSession(object):
+	# a c-gate command session (port 20023).  every command is tagged with a command id, e.g. "[12] on 254/56/1",
+	# and c-gate tags its reply with the same id.  this allows many commands to be in flight at once with each
+	# reply matched back to the command which caused it.
+
+	replyPattern = re.compile("\[(\d+)\] ((\d{3})([ -]).*)")
+
+	def __init__(self, location, port, logger, timeout=5):
+		self.logger = logger
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.pending = {}
+		self.commandId = 0
+		# see TrafficRecorder
+		self.recorder = None
+		self.channel = LineSocket(location, port)
+		try:
+			self.waitForServiceReady()
+		except Exception:
+			self.channel.close()
+			raise
+		self.alive = True
+		self.reader = threading.Thread(target=self.readReplies)
+		self.reader.daemon = True
+		self.reader.start()
+
+	def waitForServiceReady(self):
+		deadline = time.time() + self.timeout
+		while time.time() < deadline:
+			for line in self.channel.readLines(max(0, deadline - time.time())):
+				if line.startswith("201"):
+					return
+		raise EOFError
+
+	def send(self, command, callback=None, timeout=None, lineCallback=None):
+		result = CommandResult(command, callback, lineCallback)
+		with self.lock:
+			if self.alive:
+				self.commandId = self.commandId % 9999 + 1
+				result.deadline = time.time() + (timeout or self.timeout)
+				self.pending[self.commandId] = result
+				try:
+					self.channel.write("[%d] %s\r\n" % (self.commandId, command))
+					if self.recorder:
+						self.recorder.record("c", "[%d] %s" % (self.commandId, command))
+					return result
+				except socket.error:
+					del self.pending[self.commandId]
+		# the session is unusable so fail the command straight away
+		result.complete(self.logger)
+		return result
+
+	def execute(self, command, timeout=None, lineCallback=None):
+		# send a command and block until the reply arrives
+		result = self.send(command, timeout=timeout, lineCallback=lineCallback)
+		result.wait()
+		return result
+
+	def readReplies(self):
+		while self.alive:
+			try:
+				for line in self.channel.readLines(0.5):
+					recorder = self.recorder
+					if recorder:
+						recorder.record("r", line)
+					self.handleReply(line)
+			except (EOFError, socket.error, select.error):
+				if self.alive:
+					self.logger.warn("c-gate command session closed")
+				self.alive = False
+			self.expire()
+		# nothing more will arrive so fail anything still outstanding
+		self.expire(True)
+
+	def handleReply(self, line):
+		m = self.replyPattern.match(line)
+		if not m:
+			return
+		commandId = int(m.group(1))
+		with self.lock:
+			result = self.pending.get(commandId)
+			if result == None:
+				# a late reply to a command we have already given up on
+				return
+			if m.group(4) == " ":
+				# a space after the response code marks the final line of the reply
+				del self.pending[commandId]
+				result.code = int(m.group(3))
+		if result.lineCallback:
+			result.lineCallback(m.group(2))
+		else:
+			result.lines.append(m.group(2))
+		if result.code != None:
+			result.complete(self.logger)
+
+	def expire(self, everything=False):
+		now = time.time()
+		with self.lock:
+			expired = [commandId for commandId in self.pending if everything or self.pending[commandId].deadline < now]
+			results = [self.pending.pop(commandId) for commandId in expired]
+		for result in results:
+			self.logger.warn("no reply from c-gate for \"%s\"" % (result.command))
+			result.complete(self.logger)
+
+	def outstanding(self):
+		return len(self.pending)
+
+	def close(self):
+		self.alive = False
+		self.channel.close()
+
+class CommandSessionPool(object):
+	# a pool of c-gate command sessions shared by indigo actions and the monitoring thread.  commands for the
+	# same key (typically a group address) always use the same session so they reach c-gate in order, otherwise
+	# the least busy session is used.  dead sessions are replaced by maintain() which also health checks the pool
+
+	def __init__(self, location, port, size, logger):
+		self.location = location
+		self.port = port
+		self.logger = logger
+		self.lock = threading.Lock()
+		self.healthChecks = {}
+		self.recorder = None
+		# set whilst dead sessions are being replaced in the background, see maintain
+		self.replacing = False
+		self.closed = False
+		self.sessions = []
+		try:
+			for index in range(size):
+				self.sessions.append(CommandSession(location, port, logger))
+		except Exception:
+			# c-gate may refuse a session part way through the pool, e.g. once its session limit is reached.  the
+			# sessions already opened are closed as loadConnections will open a whole new pool when it retries
+			for session in self.sessions:
+				session.close()
+			raise
+
+	def setRecorder(self, recorder):
+		self.recorder = recorder
+		for session in self.sessions:
+			session.recorder = recorder
+
+	def session(self, key=None):
+		with self.lock:
+			live = [session for session in self.sessions if session.alive]
+			if key != None and self.sessions[hash(key) % len(self.sessions)].alive:
+				return self.sessions[hash(key) % len(self.sessions)]
+		if live:
+			return min(live, key=lambda session: session.outstanding())
+		return None
+
+	def send(self, command, callback=None, timeout=None, key=None, lineCallback=None):
+		session = self.session(key)
+		if session == None:
+			result = CommandResult(command, callback, lineCallback)
+			result.complete(self.logger)
+			return result
+		return session.send(command, callback, timeout, lineCallback)
+
+	def execute(self, command, timeout=None, key=None, lineCallback=None):
+		result = self.send(command, timeout=timeout, key=key, lineCallback=lineCallback)
+		result.wait()
+		return result
+
+	def alive(self):
+		# False once every session has died, at which point every command fails straight away
+		return any([session.alive for session in self.sessions])
+
+	def maintain(self):
+		# called from the monitoring thread so it must not block.  opening a session can take several seconds so dead
+		# sessions are replaced on a background thread, live sessions are health checked with a noop
+		dead = False
+		for session in list(self.sessions):
+			if not session.alive:
+				dead = True
+			elif session not in self.healthChecks:
+				self.healthChecks[session] = session.send("noop", lambda result, session=session: self.healthCheckComplete(session, result))
+		with self.lock:
+			if not dead or self.replacing or self.closed:
+				return
+			self.replacing = True
+		replace = threading.Thread(target=self.replaceDeadSessions)
+		replace.daemon = True
+		replace.start()
+
+	def replaceDeadSessions(self):
+		try:
+			for index, session in enumerate(list(self.sessions)):
+				if session.alive or self.closed:
+					continue
+				try:
+					replacement = CommandSession(self.location, self.port, self.logger)
+					replacement.recorder = self.recorder
+				except Exception:
+					self.logger.warn("unable to replace c-gate command session %d" % (index+1))
+					continue
+				with self.lock:
+					if not self.closed:
+						self.sessions[index] = replacement
+						replacement = None
+				if replacement:
+					# the pool was closed whilst the session was being opened
+					replacement.close()
+				else:
+					self.logger.info("replaced c-gate command session %d" % (index+1))
+		finally:
+			self.replacing = False
+
+	def healthCheckComplete(self, session, result):
+		self.healthChecks.pop(session, None)
+		if not result.ok:
+			self.logger.warn("c-gate command session failed health check")
+			session.close()
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+		for session in self.sessions:
+			session.close()
+
+class Network(object):
+	# a c-bus network and everything the plugin holds for it: the c-gate server it is reached through, its command
+	# sessions and monitor connection and its project model.  each network is monitored by its own thread (see
+	# Plugin.runNetwork) so one network reconnecting or resynchronising does not hold up the others
+
+	def __init__(self, location, number, logger):
+		self.location = location
+		self.number = number
+		self.logger = logger
+		self.connection = None
+		self.monitor = None
+		self.validConnections = False
+		# held whilst the connections are being reopened so only one thread reconnects the network at a time.  the
+		# monitoring thread and a background project refresh may both notice c-gate going away
+		self.connectionLock = threading.RLock()
+		# cleared when the network is removed from the plugin configuration
+		self.running = True
+		self.thread = None
+		self.nextHealthCheck = 0
+		self.projectName = ""
+		self.lightingMap = {}
+		self.securityMap = {}
+		self.unitMap = {}
+		# when each lighting group was last reported on the monitor port, so a refresh never applies an older level
+		# from tree over it
+		self.lightingReported = {}
+		# the last known status report value of zones 1-80. None means the zone's state is unknown
+		self.zoneStateVector = [None] * 80
+
+	def send(self, command, callback=None, timeout=None, key=None, lineCallback=None):
+		# as CommandSessionPool.send, but the command fails straight away if the network is not yet connected
+		connection = self.connection
+		if connection == None:
+			result = CommandResult(command, callback, lineCallback)
+			result.complete(self.logger)
+			return result
+		return connection.send(command, callback, timeout, key, lineCallback)
+
+	def execute(self, command, timeout=None, key=None, lineCallback=None):
+		result = self.send(command, timeout=timeout, key=key, lineCallback=lineCallback)
+		result.wait()
+		return result
+
+	def close(self):
+		self.running = False
+		self.validConnections = False
+		if self.connection:
+			self.connection.close()
+		if self.monitor:
+			self.monitor.close()
+
 class Plugin(indigo.PluginBase):
 
 	def __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):
 		indigo.PluginBase.__init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs)
-		self.validConnections = False
 		self.events = {}
+		# triggers indexed by (trigger type, group address or device id, change type) and the key used for each trigger
+		self.triggerIndex = {}
+		self.triggerKeys = {}
+		# (scheduler handle, ramp event) of each key-held ramp in progress, keyed by group address
 		self.currentTimers = {}
 		self.cgateLocation = pluginPrefs.get("cgateNetworkLocation", "127.0.0.1")
-		self.cbusNetwork = pluginPrefs.get("cbusNetwork", "254")
+		self.sessionPoolSize = int(pluginPrefs.get("cgateSessionPoolSize", 3))
+		# bounds (in seconds) of the jittered exponential backoff used whilst c-gate is unavailable
+		self.reconnectMinimumDelay = 0.5
+		self.reconnectMaximumDelay = 30
+		# group addresses awaiting a status request.  requests within the window share one bulk level query
+		self.statusRequests = set()
+		self.statusRequestTimer = None
+		self.statusRequestWindow = 0.25
+		self.statusRequestLock = threading.Lock()
+		# hot path timings and counters, reported from the plugin menu and optionally every few minutes
+		self.metrics = Metrics()
+		self.metricsLogInterval = int(pluginPrefs.get("metricsLogInterval", 0))
+		self.metricsTimer = None
+		# records raw c-gate traffic whilst enabled from the plugin menu, see TrafficRecorder
+		self.recorder = None
+		self.dispatcher = None
+		self.scheduler = None
+		# light sensors are polled every lightSensorInterval seconds to begin with.  the interval for each sensor then
+		# adapts (between the minimum and maximum) to how often its value changes.  keyed by device id
+		self.lightSensorPolling = {}
+		self.lightSensorInterval = 60
+		self.lightSensorMinimumInterval = 15
+		self.lightSensorMaximumInterval = 600
+		self.lightSensorTimer = None
+		self.nextLightSensorRead = 0
+		# the timer is rescheduled from the scheduler and from command replies.  each timer carries a generation so a
+		# run which has been superseded by a newer timer knows to stop
+		self.lightSensorGeneration = 0
+		self.lightSensorLock = threading.Lock()
+		# when each light sensor last broadcast its level on the measurement application, keyed by device id
+		self.lightSensorPushed = {}
+		self.eventWorkers = 4
+		self.eventQueueDepth = 1000
+		self.reportedBackpressure = (0, 0)
+		# target levels of ramps which have been sent to c-gate (or queued) but not yet acknowledged, keyed by device address
+		self.pendingLevels = {}
+		# brightness changes for a group within the window are merged and only the latest level is sent, see queueRamp.
+		# (device, action, level, scheduler handle) keyed by device address
+		self.queuedRamps = {}
+		self.queuedRampLock = threading.Lock()
+		self.rampWindow = int(pluginPrefs.get("brightnessWindow", 250)) / 1000.0
+		# in optimistic mode lighting devices are updated as commands are sent.  the change is confirmed when c-gate
+		# echoes it on the monitor port and rolled back if the command fails or no echo arrives within the timeout.
+		# the state to roll back to and the timeout's scheduler handle are kept for each unconfirmed device address
+		self.optimisticUpdates = pluginPrefs.get("optimisticUpdates", False)
+		self.optimisticTimeout = 5
+		self.unconfirmedStates = {}
+		self.unconfirmedLock = threading.Lock()
+		# broadcasts are sent to subscribing plugins individually (as in earlier versions), batched, or both.  batched
+		# broadcasts within the window are sent as a single stateChangeBatch message, see broadcast
+		self.broadcastMode = pluginPrefs.get("broadcastMode", "individual")
+		self.pendingBroadcasts = []
+		self.broadcastTimer = None
+		self.broadcastWindow = 0.25
+		self.broadcastLock = threading.Lock()
 		self.cbusSecurityEnabled = pluginPrefs.get("cbusSecurityEnabled", False)
-		self.cbusProjectName = ""
-		self.cbusLightingMap = {}
-		self.cbusSecurityMap = {}
-		self.cbusUnitMap = {}
+		# each c-bus network keyed by its network number, the primary network first.  device addresses begin with the
+		# network number so network numbers must be unique across c-gate servers
+		try:
+			configuration = self.configuredNetworks(pluginPrefs)
+		except ValueError:
+			self.logger.error("invalid c-bus network configuration. monitoring network 254 only")
+			configuration = [(self.cgateLocation, "254")]
+		self.networks = collections.OrderedDict([(number, Network(location, number, self.logger)) for location, number in configuration])
+		# the project cache is shared by every network
+		self.projectCacheLock = threading.Lock()
+		# maps the address of each plugin device (e.g. 254/56/12) to its indigo device id
+		self.deviceAddressMap = {}
+		# the last value written to indigo for each device state, keyed by device id.  see updateDeviceStates
+		self.shadowStates = {}
+		self.shadowLock = threading.Lock()
 		
-		# set up the dispatch table
+		# set up the dispatch table, keyed on the (application, command) of each MonitorEvent
 		self.dispatchTable = {
-			"lighting_ramp": self.lightingRamp,
-			"lighting_terminateramp": self.lightingTerminateRamp,
-			"lighting_on": self.lightingOn,
-			"lighting_off": self.lightingOff,
-			"security_zone_unsealed": self.zoneUnsealed,
-			"security_zone_sealed": self.zoneSealed,
-			"security_zone_open": self.zoneOpen,
-			"security_zone_short": self.zoneShort,
-			"security_zone_isolated": self.zoneIsolated,
-			"security_arm_not_ready": self.zoneArmNotReady,
-			"security_arm_ready": self.panelArmReady,
-			"security_system_arm": self.panelSystemArmed,
-			"security_system_disarmed": self.panelSystemDisarmed,
-			"security_exit_delay_started": self.panelExitDelay,
-			"security_entry_delay_started": self.panelEntryDelay,
-			"security_alarm_on": self.panelAlarmOn,
-			"security_current_alarm_type": self.panelAlarmType,
-			"security_alarm_off": self.panelAlarmOff,
-			"security_tamper_on": self.panelTamperOn,
-			"security_tamper_off": self.panelTamperOff,
-			"security_panic_activated": self.panelPanicActivated,
-			"security_panic_cleared": self.panelPanicCleared,
-			"security_battery_charging": self.panelBatteryCharging,
-			"security_low_battery_detected": self.panelLowBatteryDetected,
-			"security_low_battery_corrected": self.panelLowBatteryCorrected,
-			"security_mains_failure": self.panelMainsFailure,
-			"security_mains_restored": self.panelMainsRestored,
-			"security_status_report_1": self.panelStatusReportOne,
-			"security_status_report_2": self.panelStatusReportTwo
+			("lighting", "ramp"): self.lightingRamp,
+			("lighting", "terminateramp"): self.lightingTerminateRamp,
+			("lighting", "on"): self.lightingOn,
+			("lighting", "off"): self.lightingOff,
+			("security", "zone_unsealed"): self.zoneUnsealed,
+			("security", "zone_sealed"): self.zoneSealed,
+			("security", "zone_open"): self.zoneOpen,
+			("security", "zone_short"): self.zoneShort,
+			("security", "zone_isolated"): self.zoneIsolated,
+			("security", "arm_not_ready"): self.zoneArmNotReady,
+			("security", "arm_ready"): self.panelArmReady,
+			("security", "system_arm"): self.panelSystemArmed,
+			("security", "system_disarmed"): self.panelSystemDisarmed,
+			("security", "exit_delay_started"): self.panelExitDelay,
+			("security", "entry_delay_started"): self.panelEntryDelay,
+			("security", "alarm_on"): self.panelAlarmOn,
+			("security", "current_alarm_type"): self.panelAlarmType,
+			("security", "alarm_off"): self.panelAlarmOff,
+			("security", "tamper_on"): self.panelTamperOn,
+			("security", "tamper_off"): self.panelTamperOff,
+			("security", "panic_activated"): self.panelPanicActivated,
+			("security", "panic_cleared"): self.panelPanicCleared,
+			("security", "battery_charging"): self.panelBatteryCharging,
+			("security", "low_battery_detected"): self.panelLowBatteryDetected,
+			("security", "low_battery_corrected"): self.panelLowBatteryCorrected,
+			("security", "mains_failure"): self.panelMainsFailure,
+			("security", "mains_restored"): self.panelMainsRestored,
+			("security", "status_report_1"): self.panelStatusReportOne,
+			("security", "status_report_2"): self.panelStatusReportTwo,
+			("measurement", "data"): self.measurementData
 		}
 		
 		# set up some mappings from C-Bus to Device states
@@ -78,6 +894,7 @@ class Plugin(indigo.PluginBase):
 			"3": "open",
 			"4": "short"
 		}
+		self.zoneStateCodes = dict([(state, code) for code, state in self.zoneStates.items()])
 		self.alarmArmedStates = {
 			"0": "disarmed",
 			"1": "away",
@@ -90,63 +907,212 @@ class Plugin(indigo.PluginBase):
 
 	def startup(self):
 		self.logger.info("starting c-bus plugin")
+		self.dispatcher = EventDispatcher(self.eventWorkers, self.eventQueueDepth, self.logger, self.metrics)
+		self.scheduler = Scheduler(self.logger)
+		self.scheduleMetricsLog()
+		self.scheduleLightSensorRead(time.time() + self.lightSensorInterval)
 		self.fixAlarmZones()
-		if self.loadConnections(self.cgateLocation):
-			self.getReadyState()
+		self.buildDeviceAddressMap()
+		for network in self.networks.values():
+			self.startNetwork(network)
+
+	def startNetwork(self, network):
+		# with the cached project model existing devices are online as soon as the network is connected.  devices are
+		# only created by the refresh from c-gate, so groups which are no longer in the project never come back
+		self.loadProjectCache(network)
+		network.thread = threading.Thread(target=self.runNetwork, args=(network,))
+		network.thread.daemon = True
+		network.thread.start()
+
+	def refreshProjectModel(self, network):
+		try:
+			self.getReadyState(network)
 
 			# refactor to pass application ID and type (e.g. 'lighting')
-			self.cbusLightingMap = self.generateGroupData('56','lighting')
+			lightingMap = self.generateGroupData(network, '56', 'lighting')
 
 			# find unit types in order to map lighiting groups to channel types
-			self.generateDeviceTypesPerGroup()
+			treeQueried = time.time()
+			unitMap, groupUnitTypes = self.generateDeviceTypesPerGroup(network, lightingMap)
 
 			# map channel types to groups
-			self.mapLightingDevices()
-			self.createLightingDevices()
+			self.mapLightingDevices(lightingMap, groupUnitTypes)
+
+			network.lightingMap = lightingMap
+			network.unitMap = unitMap
+			self.createLightingDevices(network, treeQueried)
 
 			# generate Security devices if needed
-			if self.cbusSecurityEnabled:
-				self.cbusSecurityMap = self.generateGroupData('208','security')
-				self.createSecurityPanel()
-				self.createSecurityZones()
-				# at this point we have no state for any device. this is determined via a status_request - see concurrent thread
+			if self.securityEnabled(network):
+				network.securityMap = self.generateGroupData(network, '208', 'security')
+				self.createSecurityPanel(network)
+				self.createSecurityZones(network)
+				# at this point we have no state for any device. this is determined via a status_request - see runNetwork
+
+			self.saveProjectCache(network)
+		except self.StopThread:
+			pass
+		except Exception:
+			self.logger.exception("unable to refresh the c-bus project for network %s from c-gate" % (network.number))
 
 	def shutdown(self):
 		self.logger.info("stopping c-bus plugin")
-		if self.validConnections:
-			self.connection.close()
+		for network in self.networks.values():
+			network.close()
+		if self.dispatcher:
+			self.dispatcher.stop()
+		if self.scheduler:
+			self.scheduler.stop()
+		self.sendBroadcasts()
+		if self.recorder:
+			self.recorder.close()
+
+	def configuredNetworks(self, prefs):
+		# returns the (c-gate location, network number) of each configured network.  the primary c-gate may serve a
+		# comma separated list of networks, networks behind other c-gate servers are listed as location/network
+		location = prefs.get("cgateNetworkLocation", "127.0.0.1").strip()
+		networks = [(location, number.strip()) for number in prefs.get("cbusNetwork", "254").split(",")]
+		for entry in prefs.get("cbusAdditionalNetworks", "").split(","):
+			if entry.strip():
+				networkLocation, separator, number = entry.strip().rpartition("/")
+				networks.append((networkLocation.strip(), number.strip()))
+		numbers = [number for networkLocation, number in networks]
+		for networkLocation, number in networks:
+			if not networkLocation or not number.isdigit() or numbers.count(number) > 1:
+				raise ValueError(number)
+		return networks
+
+	def primaryNetwork(self):
+		return self.networks.values()[0]
+
+	def securityEnabled(self, network):
+		# I currently presume there is only one c-bus enabled alarm panel, on the primary network
+		return self.cbusSecurityEnabled and network is self.primaryNetwork()
+
+	def networkFor(self, address):
+		# the network an unqualified address (e.g. 254/56/12) belongs to, or None if it is not configured
+		return self.networks.get(address.split("/")[0])
+
+	def deviceNetwork(self, device):
+		network = self.networkFor(device.address)
+		if network == None:
+			self.logger.warn("\"%s\" is on c-bus network %s which is not configured" % (device.name, device.address.split("/")[0]))
+		return network
+
+	def reconfigureNetworks(self, configuration):
+		# stop networks which have been removed or moved to another c-gate and start any new ones.  networks which
+		# are unchanged carry on undisturbed
+		for number, network in self.networks.items():
+			if (network.location, number) not in configuration:
+				self.logger.info("stopping c-bus network %s" % (number))
+				network.close()
+		networks = collections.OrderedDict()
+		for location, number in configuration:
+			network = self.networks.get(number)
+			if network == None or not network.running:
+				network = Network(location, number, self.logger)
+				if self.dispatcher:
+					self.startNetwork(network)
+			networks[number] = network
+		self.networks = networks
 
 	def validatePrefsConfigUi(self, valuesDict):
-		if self.loadConnections(valuesDict["cgateNetworkLocation"]):
-			self.cgateLocation = valuesDict["cgateNetworkLocation"]
-			return True
-		else:
+		try:
+			if int(valuesDict.get("cgateSessionPoolSize", 3)) < 1:
+				raise ValueError
+		except ValueError:
 			errorDict = indigo.Dict()
-			errorDict["cgateNetworkLocation"] = "Invalid location"
+			errorDict["cgateSessionPoolSize"] = "Must be a whole number greater than zero"
 			return (False, valuesDict, errorDict)
+		try:
+			if int(valuesDict.get("brightnessWindow", 250)) < 0:
+				raise ValueError
+		except ValueError:
+			errorDict = indigo.Dict()
+			errorDict["brightnessWindow"] = "Must be a whole number of milliseconds, or 0 to disable"
+			return (False, valuesDict, errorDict)
+		try:
+			if int(valuesDict.get("metricsLogInterval", 0)) < 0:
+				raise ValueError
+		except ValueError:
+			errorDict = indigo.Dict()
+			errorDict["metricsLogInterval"] = "Must be a whole number of minutes, or 0 to disable"
+			return (False, valuesDict, errorDict)
+		try:
+			configuration = self.configuredNetworks(valuesDict)
+		except ValueError:
+			errorDict = indigo.Dict()
+			errorDict["cbusAdditionalNetworks"] = "Use location/network for each network. Network numbers must be unique"
+			return (False, valuesDict, errorDict)
+		for location in set([location for location, number in configuration]):
+			try:
+				socket.create_connection((location, 20023), 5).close()
+			except socket.error:
+				errorDict = indigo.Dict()
+				if location == valuesDict["cgateNetworkLocation"].strip():
+					errorDict["cgateNetworkLocation"] = "Invalid location"
+				else:
+					errorDict["cbusAdditionalNetworks"] = "Unable to connect to C-Gate at "+location
+				return (False, valuesDict, errorDict)
+		self.sessionPoolSize = int(valuesDict.get("cgateSessionPoolSize", 3))
+		self.rampWindow = int(valuesDict.get("brightnessWindow", 250)) / 1000.0
+		self.optimisticUpdates = valuesDict.get("optimisticUpdates", False)
+		self.broadcastMode = valuesDict.get("broadcastMode", "individual")
+		self.metricsLogInterval = int(valuesDict.get("metricsLogInterval", 0))
+		if self.scheduler:
+			self.scheduleMetricsLog()
+		self.cgateLocation = valuesDict["cgateNetworkLocation"].strip()
+		self.reconfigureNetworks(configuration)
+		return True
 
 	def validateDeviceConfigUi(self, valuesDict, typeId, devId):
-		proposedAddress = self.cbusNetwork+"/p/"+valuesDict["lightSensorAddress"]
-		device = None
-		for dev in indigo.devices.iter("self"):
-			if dev.address == proposedAddress:
-				device = indigo.devices[dev.name]
-		if device == None:
-			valuesDict["address"] = proposedAddress
-			valuesDict["SupportsSensorValue"] = True
-			valuesDict["sensorValue"] = 0
-			return (True, valuesDict)
-		else:
-			errorDict = indigo.Dict()
-			errorDict["lightSensorAddress"] = "Unit already specified in Indigo"
+		errorDict = indigo.Dict()
+		unitAddress = valuesDict.get("lightSensorAddress", "").strip()
+		measurementChannel = valuesDict.get("measurementChannel", "").strip()
+		proposedAddress = ""
+		measurementAddress = ""
+		# sensors on the primary network may leave out the network number
+		if unitAddress:
+			proposedAddress = self.sensorAddress(unitAddress, "p", 1)
+			if not re.match("^(\d+\/)?\w+$", unitAddress):
+				errorDict["lightSensorAddress"] = "Use the unit address, or network/unit for other networks"
+			elif self.networkFor(proposedAddress) == None:
+				errorDict["lightSensorAddress"] = "C-Bus network not configured"
+			elif self.deviceAddressMap.get(proposedAddress, devId) != devId:
+				errorDict["lightSensorAddress"] = "Unit already specified in Indigo"
+		if measurementChannel:
+			measurementAddress = self.sensorAddress(measurementChannel, "228", 2)
+			if not re.match("^(\d+\/)?\d+\/\d+$", measurementChannel):
+				errorDict["measurementChannel"] = "Use the form device/channel, e.g. 1/0"
+			elif self.networkFor(measurementAddress) == None:
+				errorDict["measurementChannel"] = "C-Bus network not configured"
+			elif self.deviceAddressMap.get(measurementAddress, devId) != devId:
+				errorDict["measurementChannel"] = "Measurement channel already specified in Indigo"
+		if not unitAddress and not measurementChannel:
+			errorDict["lightSensorAddress"] = "Specify a unit address and/or a measurement channel"
+		if len(errorDict) > 0:
 			return (False, valuesDict, errorDict)
+		# sensors which only broadcast their level are addressed by their measurement channel
+		valuesDict["address"] = proposedAddress or measurementAddress
+		valuesDict["measurementAddress"] = measurementAddress
+		valuesDict["SupportsSensorValue"] = True
+		valuesDict["sensorValue"] = 0
+		return (True, valuesDict)
+
+	def sensorAddress(self, address, application, parts):
+		# qualify a sensor's unit (e.g. 12) or measurement channel (e.g. 1/0) with the application and, if it was
+		# left out, the primary network
+		fields = address.split("/")
+		if len(fields) == parts:
+			fields = [self.primaryNetwork().number] + fields
+		return "/".join([fields[0], application] + fields[1:])
 		
 	def checkboxChanged(self, valuesDict):
 		if valuesDict["cbusSecurityEnabled"] == True:
 			self.logger.info("enabling c-bus security feature")
 			self.cbusSecurityEnabled = True
-			if self.cbusSecurityEnabled and self.validConnections:
-				self.requestSecurityStatus()
+			if self.primaryNetwork().validConnections:
+				self.requestSecurityStatus(self.primaryNetwork())
 		else:
 			self.logger.info("disabling c-bus security feature")
 			self.cbusSecurityEnabled = False
@@ -157,56 +1123,200 @@ class Plugin(indigo.PluginBase):
 			self.events[trigger.pluginTypeId] = {trigger.id: trigger}
 		else:
 			self.events[trigger.pluginTypeId][trigger.id] = trigger
+		key = self.triggerIndexKey(trigger)
+		if key:
+			self.triggerIndex.setdefault(key, set()).add(trigger.id)
+			self.triggerKeys[trigger.id] = key
 
 	def triggerStopProcessing(self, trigger):
 		if trigger.pluginTypeId in self.events and trigger.id in self.events[trigger.pluginTypeId]:
 			del self.events[trigger.pluginTypeId][trigger.id]
+		key = self.triggerKeys.pop(trigger.id, None)
+		if key in self.triggerIndex:
+			self.triggerIndex[key].discard(trigger.id)
+			if not self.triggerIndex[key]:
+				del self.triggerIndex[key]
+
+	def triggerIndexKey(self, trigger):
+		# group triggers are keyed on group address and change type, zone triggers on the zone device id.
+		# panel and "any group" triggers fire for every event of their type so are found via self.events
+		if trigger.pluginTypeId == "groupManuallyChanged":
+			return (trigger.pluginTypeId, trigger.pluginProps.get('group', ""), trigger.pluginProps.get('changeType', "any"))
+		if trigger.pluginProps.get('device', ""):
+			return (trigger.pluginTypeId, str(trigger.pluginProps['device']), None)
+		return None
+
+	def executeTriggers(self, key):
+		for trigger in list(self.triggerIndex.get(key, ())):
+			self.executeTrigger(trigger)
+
+	def deviceCreated(self, dev):
+		indigo.PluginBase.deviceCreated(self, dev)
+		if dev.pluginId == self.pluginId:
+			self.addDeviceAddress(dev)
+			if dev.deviceTypeId == "cbusLightSensor" and self.scheduler:
+				# read the new sensor now rather than when the next sensor is due
+				self.scheduleLightSensorRead(time.time())
+
+	def deviceUpdated(self, origDev, newDev):
+		indigo.PluginBase.deviceUpdated(self, origDev, newDev)
+		if newDev.pluginId == self.pluginId and self.deviceAddresses(origDev) != self.deviceAddresses(newDev):
+			self.removeDeviceAddress(origDev)
+			self.addDeviceAddress(newDev)
+
+	def deviceDeleted(self, dev):
+		indigo.PluginBase.deviceDeleted(self, dev)
+		if dev.pluginId == self.pluginId:
+			self.removeDeviceAddress(dev)
+			self.shadowStates.pop(dev.id, None)
+			self.lightSensorPolling.pop(dev.id, None)
+			self.lightSensorPushed.pop(dev.id, None)
 
 	########################################
 	# MONITORING
 	########################################
 
 	def runConcurrentThread(self):
+		# each network is monitored by its own thread, see runNetwork.  this thread keeps an eye on the event queue
 		self.logger.info("starting c-bus monitoring thread")
-		# we have a connection so if security is enabled let's request an initial status
-		if self.cbusSecurityEnabled and self.validConnections:
-			self.requestSecurityStatus()
-		counter = 0
 		while self.stopThread == False:
-			if self.validConnections:
+			stats = self.dispatcher.stats()
+			merged, blocked = self.reportedBackpressure
+			if stats['merged'] > merged or stats['blocked'] > blocked:
+				self.logger.warn("c-bus event queue full. %d events merged, monitoring paused %d times" % (stats['merged'] - merged, stats['blocked'] - blocked))
+				self.reportedBackpressure = (stats['merged'], stats['blocked'])
+			self.sleep(30)
+
+	def runNetwork(self, network):
+		# connect to the network's c-gate, bring its project model up to date and then monitor it until the plugin
+		# stops or the network is removed from the configuration
+		try:
+			if not self.loadConnections(network):
+				return
+			if network.lightingMap:
+				# the model is already loaded from the cache so it is refreshed alongside monitoring
+				refresh = threading.Thread(target=self.refreshProjectModel, args=(network,))
+				refresh.daemon = True
+				refresh.start()
+			else:
+				self.refreshProjectModel(network)
+			# we have a connection so if security is enabled let's request an initial status
+			if self.securityEnabled(network):
+				self.requestSecurityStatus(network)
+			self.monitorNetwork(network)
+		except self.StopThread:
+			pass
+		finally:
+			if network.monitor:
+				network.monitor.close()
+
+	def monitorNetwork(self, network):
+		while self.stopThread == False and network.running:
+			try:
+				# wakes as soon as data arrives. only complete lines are returned, partial lines stay buffered
+				lines = network.monitor.readLines(1)
+			except (EOFError, socket.error, select.error):
+				if not network.running:
+					return
+				self.logger.warn("lost connection to c-gate for network %s. attempting to reconnect" % (network.number))
+				self.reconnect(network)
+				continue
+			recorder = self.recorder
+			for line in lines:
+				if recorder:
+					recorder.record("m", line)
 				try:
-					data = self.readUntil(self.monitor, ".*\n")
-					# we might receive multiple lines in this data string.
-					for line in data.split('\n'):
-						if line:
-							if line.startswith("# "):
-								line = line[2:]
-							# split on space and concat 0 and 1. look up in the dispatch table
-							action = line.split()
-							if len(action) < 2:
-								continue
-							try:
-								lookup = action[0]+"_"+action[1]
-								if lookup in self.dispatchTable:
-									self.dispatchTable[lookup](action[2:])
-							except IndexError:
-								self.logger.warn("index error: %s" % (line))
+					self.processMonitorLine(line, network)
 				except Exception:
-					self.logger.warn("exception occurred whilst monitoring c-bus")
-					pass
-				counter = counter + 1
-				if counter > 60:
-					self.readLightSensors()
-					counter = 0
-			else:
-				# wait a while to see if the user gives us a valid c-gate configuration
-				self.sleep(5)
-		if self.validConnections:
-			self.monitor.close()
+					self.logger.warn("exception occurred whilst monitoring c-bus: %s" % (line))
+			if time.time() > network.nextHealthCheck:
+				network.connection.maintain()
+				network.nextHealthCheck = time.time() + 30
 
 	def stopConcurrentThread(self):
 		self.stopThread = True
 
+	def orderingKey(self, event):
+		# events with the same key are handled in order.  security status reports cover every zone so all security
+		# events share the application's ordering
+		if event.application == "security":
+			return "/".join(event.address.split("/")[:2])
+		return event.address
+
+	def logEventQueueStatistics(self):
+		stats = self.dispatcher.stats()
+		self.logger.info("c-bus event queue: %d queued (max %d), %d dispatched, %d handled, %d merged, %d waits for room" % (stats['depth'], stats['maxDepth'], stats['dispatched'], stats['handled'], stats['merged'], stats['blocked']))
+		self.logger.info("c-bus scheduler: %d calls pending" % (self.scheduler.pending()))
+
+	def logPerformanceMetrics(self):
+		for line in self.metrics.report():
+			self.logger.info(line)
+		# ramp timers, polls and batched work waiting on the scheduler
+		if self.scheduler:
+			self.logger.info("scheduled calls pending: %d" % (self.scheduler.pending()))
+
+	def resetPerformanceMetrics(self):
+		self.metrics.reset()
+		self.logger.info("c-bus performance metrics reset")
+
+	def scheduleMetricsLog(self):
+		if self.metricsTimer:
+			self.scheduler.cancel(self.metricsTimer)
+			self.metricsTimer = None
+		if self.metricsLogInterval > 0:
+			self.metricsTimer = self.scheduler.schedule(self.metricsLogInterval * 60, self.periodicMetricsLog)
+
+	def periodicMetricsLog(self):
+		self.metricsTimer = None
+		self.logPerformanceMetrics()
+		self.scheduleMetricsLog()
+
+	def startRecordingTraffic(self):
+		if self.recorder:
+			self.logger.info("already recording c-gate traffic to %s" % (self.recorder.path))
+			return
+		path = os.path.join(indigo.server.getInstallFolderPath(), "Preferences", "Plugins", self.pluginId+"."+strftime("%Y%m%d-%H%M%S")+".trace.gz")
+		self.recorder = TrafficRecorder(path)
+		for network in self.networks.values():
+			if network.connection:
+				network.connection.setRecorder(self.recorder)
+		self.logger.info("recording c-gate traffic to %s" % (path))
+
+	def stopRecordingTraffic(self):
+		recorder = self.recorder
+		if recorder == None:
+			self.logger.info("c-gate traffic is not being recorded")
+			return
+		self.recorder = None
+		for network in self.networks.values():
+			if network.connection:
+				network.connection.setRecorder(None)
+		recorder.close()
+		self.logger.info("recorded %d lines of c-gate traffic to %s" % (recorder.lines, recorder.path))
+
+	def processMonitorLine(self, line, network=None):
+		# c-gate reports events for all of its networks on the monitor port.  if network is given only that
+		# network's events are handled, the others are handled by their own network's monitor
+		self.metrics.count("monitor events")
+		try:
+			event = parseMonitorLine(line)
+			if event and (network == None or event.address.split("/")[0] == network.number):
+				if network and event.application == "lighting":
+					network.lightingReported[event.address] = time.time()
+				handler = self.dispatchTable.get((event.application, event.command))
+				if handler == None:
+					pass
+				elif event.application == "security":
+					# handlers talk to the indigo server so they run on the dispatcher's workers, not the monitor thread.
+					# security events (alarms, zone changes and status reports) are always handled
+					self.dispatcher.dispatch(self.orderingKey(event), handler, event)
+				else:
+					# lighting and measurement events set the state of their group, so if the queue is full only the
+					# latest event for a group needs to be handled
+					self.dispatcher.dispatchLatest(self.orderingKey(event), handler, event)
+		except (IndexError, ValueError):
+			self.logger.warn("unable to parse: %s" % (line))
+
 	########################################
 	# COMMUNICATION (WITH INDIGO) FUNCTIONS
 	########################################
@@ -217,9 +1327,9 @@ class Plugin(indigo.PluginBase):
 	def valueToIndigo(self, value):
 		return int(int(value) / 2.55)
 
-	def updateIndigoLightingState(self, device, state, brightness, source="self"):
+	def updateIndigoLightingState(self, device, state, brightness, sourceUnit=None):
 		if device:
-			if source is not "self":
+			if sourceUnit != None:
 				# only generate broadcasts when state changes are seen on the c-bus network. it's a sure way to
 				# know that changes Indigo generates have taken effect.
 				broadcastType = u"lightingStateChanged"
@@ -229,127 +1339,371 @@ class Plugin(indigo.PluginBase):
 				if device.deviceTypeId == "cbusDimmer":
 					broadcastPacket['type'] = "dimmer"
 					broadcastPacket['brightness'] = self.valueToIndigo(brightness)
-				source = source.split("=")[1]
-				if self.cbusUnitMap[source]['unit'] == "cbusSwitch":
+				network = self.networkFor(device.address)
+				unit = network.unitMap.get(str(sourceUnit)) if network else None
+				if unit and unit['unit'] == "cbusSwitch":
 					# specific behaviours if the request originated from the c-bus network, therefore a manual update
 					broadcastType = u"lightingStateManuallyChanged"
-					if "groupManuallyChanged" in self.events:
-						for trigger in self.events["groupManuallyChanged"]:
-							if self.events["groupManuallyChanged"][trigger].pluginProps['group'] == device.address:
-								shouldTrigger = False
-								if self.events["groupManuallyChanged"][trigger].pluginProps['changeType'] == "any":
-									shouldTrigger = True
-								if self.events["groupManuallyChanged"][trigger].pluginProps['changeType'] == "on" and brightness == 255:
-									shouldTrigger = True
-								if self.events["groupManuallyChanged"][trigger].pluginProps['changeType'] == "off" and brightness == 0:
-									shouldTrigger = True
-								if shouldTrigger:
-									indigo.trigger.execute(trigger)
+					self.executeTriggers(("groupManuallyChanged", device.address, "any"))
+					if brightness == 255:
+						self.executeTriggers(("groupManuallyChanged", device.address, "on"))
+					if brightness == 0:
+						self.executeTriggers(("groupManuallyChanged", device.address, "off"))
 					if "anyGroupManuallyChanged" in self.events:
 						for trigger in self.events["anyGroupManuallyChanged"]:
-							indigo.trigger.execute(trigger)
-				indigo.server.broadcastToSubscribers(broadcastType, broadcastPacket)
-			device.updateStateOnServer("onOffState", state)
+							self.executeTrigger(trigger)
+				self.broadcast(broadcastType, broadcastPacket)
+			states = [{'key': 'onOffState', 'value': state}]
 			if device.deviceTypeId == "cbusDimmer" and brightness:
-				device.updateStateOnServer("brightnessLevel", self.valueToIndigo(brightness))
+				states.append({'key': 'brightnessLevel', 'value': self.valueToIndigo(brightness)})
+			return self.updateDeviceStates(device, states)
+		return []
 
 	def updateIndigoSecurityState(self, device, stateType, state):
 		if device:
-			device.updateStateOnServer(stateType, value=state)
-			indigo.server.broadcastToSubscribers(u"securityStateChange", {'deviceName': device.name, 'deviceAddress': device.address, 'state': state})
+			states = [{'key': stateType, 'value': state}]
 			
 			# HomeKit support
 			
+			tripped = None
 			if stateType == "state" and state in ["triggered", "monitoring", "open", "short", "isolated"]:
-				if state in ["triggered", "open", "isolated"]:
-					device.updateStateImageOnServer(indigo.kStateImageSel.SensorTripped)
-					device.updateStateOnServer("onOffState", value=True, uiValue=state)
+				tripped = state in ["triggered", "open", "isolated"]
+				states.append({'key': 'onOffState', 'value': tripped, 'uiValue': state})
+			changes = self.updateDeviceStates(device, states)
+			if tripped != None and 'onOffState' in [change['key'] for change in changes]:
+				if tripped:
+					self.updateStateImage(device, indigo.kStateImageSel.SensorTripped)
 				else:
-					device.updateStateImageOnServer(indigo.kStateImageSel.SensorOn)
-					device.updateStateOnServer("onOffState", value=False, uiValue=state)
+					self.updateStateImage(device, indigo.kStateImageSel.SensorOn)
+			self.broadcast(u"securityStateChange", {'deviceName': device.name, 'deviceAddress': device.address, 'state': state})
 			
 			# we also want to execute triggers associated to this action.
 			# the "state" value is also the name of the trigger
 			# if the device is the panel then execute all triggers
-			# if the device is a zone then iterate all triggers and find associated type based on device.address
-			if state in self.events:
+			# if the device is a zone then execute the triggers indexed against the zone's device id
+			if device.deviceTypeId == "cbusSecurityZone":
+				self.executeTriggers((state, str(device.id), None))
+			elif state in self.events:
+				# must be an alarm panel trigger
 				for trigger in self.events[state]:
-					if device.deviceTypeId == "cbusSecurityZone":
-						# check for match against specific triggers with referenced zones
-						if str(device.id) == str(self.events[state][trigger].pluginProps['device']):
-							indigo.trigger.execute(trigger)
-					else:
-						# must be an alarm panel trigger
-						indigo.trigger.execute(trigger)
+					self.executeTrigger(trigger)
+
+	def broadcast(self, broadcastType, broadcastPacket):
+		if self.broadcastMode != "batched":
+			self.broadcastToSubscribers(broadcastType, broadcastPacket)
+			self.metrics.count("broadcasts sent")
+		if self.broadcastMode in ("batched", "both"):
+			with self.broadcastLock:
+				self.pendingBroadcasts.append({'type': broadcastType, 'packet': broadcastPacket})
+				if self.broadcastTimer == None and self.scheduler:
+					self.broadcastTimer = self.scheduler.schedule(self.broadcastWindow, self.sendBroadcasts)
+
+	def sendBroadcasts(self):
+		# every state change since the first in the window, oldest first.  a whole house off becomes one message
+		with self.broadcastLock:
+			changes = self.pendingBroadcasts
+			self.pendingBroadcasts = []
+			self.broadcastTimer = None
+		if changes:
+			self.broadcastToSubscribers(u"stateChangeBatch", {'count': len(changes), 'changes': changes})
+			self.metrics.count("broadcasts sent")
+			self.metrics.count("broadcast changes batched", len(changes))
+
+	def updateDeviceStates(self, device, keyValueList):
+		# compare each state with the last value written for the device and send only those which have changed,
+		# in a single updateStatesOnServer call.  returns the states which were written
+		with self.shadowLock:
+			shadow = self.shadowStates.setdefault(device.id, {})
+			changes = []
+			for item in keyValueList:
+				if item['key'] not in shadow:
+					shadow[item['key']] = (device.states.get(item['key']), None)
+				if shadow[item['key']] != (item['value'], item.get('uiValue')):
+					shadow[item['key']] = (item['value'], item.get('uiValue'))
+					changes.append(item)
+		if changes:
+			started = time.time()
+			device.updateStatesOnServer(changes)
+			self.metrics.record("indigo updateStatesOnServer", time.time() - started)
+		return changes
+
+	# every call below is a round trip to the indigo server so each is timed, see logPerformanceMetrics
+
+	def executeTrigger(self, trigger):
+		started = time.time()
+		indigo.trigger.execute(trigger)
+		self.metrics.record("indigo trigger.execute", time.time() - started)
+
+	def broadcastToSubscribers(self, messageType, message):
+		started = time.time()
+		indigo.server.broadcastToSubscribers(messageType, message)
+		self.metrics.record("indigo broadcastToSubscribers", time.time() - started)
+
+	def updateStateImage(self, device, image):
+		started = time.time()
+		device.updateStateImageOnServer(image)
+		self.metrics.record("indigo updateStateImageOnServer", time.time() - started)
+
+	def createDevice(self, **properties):
+		started = time.time()
+		device = indigo.device.create(**properties)
+		self.metrics.record("indigo device.create", time.time() - started)
+		return device
 
 	def findDevice(self, address):
-		# remove //project name and lookup in indigo
-		m = re.match("\/\/\w+\/([\w|\/]+).*", address)
-		if m:
-			address = m.group(1)
-			for dev in indigo.devices.iter("self"):
-				if dev.address == address:
-					return indigo.devices[dev.name]
+		# remove //project name (if present) and lookup in the address map
+		if address.startswith("//"):
+			m = projectAddressPattern.match(address)
+			if m:
+				address = m.group(1)
+		devId = self.deviceAddressMap.get(address)
+		if devId != None:
+			started = time.time()
+			try:
+				return indigo.devices[devId]
+			except KeyError:
+				# the device has gone away without us hearing about it
+				del self.deviceAddressMap[address]
+			finally:
+				# fetching the device is a round trip to the indigo server
+				self.metrics.record("findDevice", time.time() - started)
 		return None
 
+	def buildDeviceAddressMap(self):
+		self.deviceAddressMap = {}
+		for dev in indigo.devices.iter("self"):
+			self.addDeviceAddress(dev)
+
+	def deviceAddresses(self, dev):
+		# light sensors may also be found by the address of the measurement channel they broadcast on
+		return [address for address in [dev.address, dev.pluginProps.get("measurementAddress", "")] if address]
+
+	def addDeviceAddress(self, dev):
+		for address in self.deviceAddresses(dev):
+			self.deviceAddressMap[address] = dev.id
+
+	def removeDeviceAddress(self, dev):
+		for address in self.deviceAddresses(dev):
+			if self.deviceAddressMap.get(address) == dev.id:
+				del self.deviceAddressMap[address]
+
 	########################################
 	# COMMUNICATION (WITH C-BUS) FUNCTIONS
 	########################################
 
-	def loadConnections(self, location):
+	def reconnect(self, network):
+		# the project model is unchanged by a lost connection so it is kept.  once c-gate is back a single bulk query
+		# picks up any levels which changed whilst we were disconnected
+		self.metrics.count("reconnects")
+		if self.loadConnections(network):
+			self.getReadyState(network)
+			self.resyncLightingLevels(network)
+			if self.securityEnabled(network):
+				self.requestSecurityStatus(network)
+
+	def reconnectDelays(self):
+		# jittered exponential backoff so c-gate is picked up quickly when it returns without being hammered whilst
+		# it is away
+		delay = self.reconnectMinimumDelay
 		while True:
-			try:
-				self.connection = telnetlib.Telnet(location, 20023)
-				# querying the physical units (e.g. Light Sensors) occurs asynchronously via concurrent thread
-				# to avoid reading the wrong data we need a second channel
-				self.thread_connection = telnetlib.Telnet(location, 20023)
-				self.monitor = telnetlib.Telnet(location, 20025)
-				self.readUntil(self.connection, "201 Service ready:.*")
-				self.readUntil(self.thread_connection, "201 Service ready:.*")
-				self.validConnections = True
-				self.logger.info("connected to C-Gate")
+			yield random.uniform(delay / 2, delay)
+			delay = min(delay * 2, self.reconnectMaximumDelay)
+
+	def loadConnections(self, network, monitor=True):
+		# returns False if the plugin stopped or the network was removed before a connection could be made.  if monitor
+		# is False only the command sessions are reopened and the monitor connection is left alone.  only one thread
+		# reconnects a network at a time, see restoreCommandSessions
+		with network.connectionLock:
+			if network.connection:
+				network.connection.close()
+			if monitor and network.monitor:
+				network.monitor.close()
+			delays = self.reconnectDelays()
+			while self.stopThread == False and network.running:
+				try:
+					# commands are tagged and pipelined over a pool of sessions, see CommandSessionPool. the pool is
+					# safe to share between indigo actions and the monitoring thread
+					network.connection = CommandSessionPool(network.location, 20023, self.sessionPoolSize, self.logger)
+					network.connection.setRecorder(self.recorder)
+					if monitor:
+						# c-gate event monitoring (port 20025) is read by the network's thread
+						network.monitor = LineSocket(network.location, 20025)
+						# zone states may have changed whilst we were disconnected
+						network.zoneStateVector = [None] * 80
+					network.validConnections = True
+					self.logger.info("connected to C-Gate at %s for network %s" % (network.location, network.number))
+					return True
+				except Exception:
+					if network.connection:
+						network.connection.close()
+					self.metrics.count("connection failures")
+					delay = next(delays)
+					self.logger.warn("unable to connect to C-Gate at %s. waiting %.1f seconds for retry" % (network.location, delay))
+					self.sleep(delay)
+			return False
+
+	def restoreCommandSessions(self, network):
+		# c-gate may close the command sessions without the monitor connection noticing, e.g. whilst the project is
+		# being read.  commands then fail straight away so rather than retrying against dead sessions they are reopened.
+		# returns True if the sessions had to be reopened
+		connection = network.connection
+		if connection == None or connection.alive():
+			return False
+		with network.connectionLock:
+			if network.connection is not connection:
+				# another thread reconnected the network whilst we waited for it
 				return True
-			except Exception:
-				self.logger.warn("unable to connect to C-Gate. waiting 10 seconds for retry")
-				self.sleep(10)
+			self.logger.warn("lost c-gate command sessions for network %s. attempting to reconnect" % (network.number))
+			if not self.loadConnections(network, False):
+				raise self.StopThread
+		return True
 
-	def getReadyState(self):
+	def getReadyState(self, network):
 		ready = False
+		delays = self.reconnectDelays()
+		# c-gate lists each of its networks on a line of its own
+		readyPattern = re.compile("\\bnetwork="+network.number+" State=ok")
 		while ready != True:
-			self.writeTo(self.connection, "net list\r\n")
-			networkState = self.readUntil(self.connection, "131.*")
-			check = re.match(".*network="+self.cbusNetwork+" State=ok.*",networkState)
+			check = [line for line in network.execute("net list").lines if readyPattern.search(line)]
 			if check:
-				self.logger.info("c-bus network ready")
+				self.logger.info("c-bus network %s ready" % (network.number))
 				ready = True
-			else:
-				self.logger.warn("c-bus network not yet ready. waiting 10 seconds for retry")
-				self.sleep(10)
-
-	def requestSecurityStatus(self):
+			elif not network.running:
+				raise self.StopThread
+			elif not self.restoreCommandSessions(network):
+				delay = next(delays)
+				self.logger.warn("c-bus network %s not yet ready. waiting %.1f seconds for retry" % (network.number, delay))
+				self.sleep(delay)
+
+	def queryLightingLevels(self, network, callback):
+		# one bulk query for the level of every group on the network's lighting application.  callback(levels, result)
+		# is run once c-gate has replied, levels maps each group address (e.g. 254/56/12) to its level
+		levels = {}
+		def parseLine(line):
+			m = levelReplyPattern.match(line)
+			if m:
+				levels[m.group(1)] = int(m.group(2))
+		return network.send("get "+network.number+"/56/* level", lambda result: callback(levels, result), timeout=30, lineCallback=parseLine)
+
+	def resyncLightingLevels(self, network):
+		self.logger.info("resynchronising c-bus lighting levels for network %s" % (network.number))
+		self.queryLightingLevels(network, lambda levels, result: self.lightingLevelsResynced(network, levels, result))
+
+	def lightingLevelsResynced(self, network, levels, result):
+		if not result.ok:
+			self.logger.warn("unable to resynchronise c-bus lighting levels for network %s" % (network.number))
+			return
+		groups = [group for group in levels if group in network.lightingMap]
+		self.queueLightingLevels(network, groups, levels)
+		self.logger.info("c-bus lighting levels received for %d groups on network %s" % (len(groups), network.number))
+
+	def queueLightingLevels(self, network, groups, levels):
+		# the levels are applied by the dispatcher as a single job, however many groups there are, so a large network
+		# can't fill the event queue.  it is queued from the scheduler as replies are handled on a command session's
+		# reader thread, which must not wait for room in the queue
+		self.scheduler.schedule(0, self.dispatcher.dispatch, network.number+"/56", self.applyLightingLevels, network, groups, levels)
+
+	def applyLightingLevels(self, network, groups, levels):
+		# only devices whose state differs from the reported level are written to indigo, see updateDeviceStates
+		for group in groups:
+			self.applyLightingLevel(network, group, levels[group])
+
+	def applyLightingLevel(self, network, group, level):
+		network.lightingMap[group]['level'] = str(level)
+		device = self.findDevice(group)
+		if device and self.updateLightingLevel(network, device, group):
+			self.logger.debug("c-bus group %s updated to level %d" % (group, level))
+
+	def requestLightingStatus(self, device):
+		with self.statusRequestLock:
+			self.statusRequests.add(device.address)
+			if self.statusRequestTimer == None:
+				self.statusRequestTimer = self.scheduler.schedule(self.statusRequestWindow, self.sendStatusRequests)
+
+	def sendStatusRequests(self):
+		with self.statusRequestLock:
+			groups = self.statusRequests
+			self.statusRequests = set()
+			self.statusRequestTimer = None
+		# one bulk query per network
+		networkGroups = {}
+		for group in groups:
+			networkGroups.setdefault(group.split("/")[0], set()).add(group)
+		for number, groups in networkGroups.items():
+			network = self.networks.get(number)
+			if network == None:
+				self.logger.warn("unable to request the status of %d groups on unconfigured c-bus network %s" % (len(groups), number))
+				continue
+			self.queryLightingLevels(network, lambda levels, result, network=network, groups=groups: self.statusRequestsComplete(network, groups, levels, result))
+
+	def statusRequestsComplete(self, network, groups, levels, result):
+		if not result.ok:
+			self.logger.warn("unable to request the status of %d c-bus groups" % (len(groups)))
+			return
+		reported = [group for group in groups if group in levels and group in network.lightingMap]
+		for group in groups.difference(reported):
+			self.logger.warn("no status reported for c-bus group %s" % (group))
+		self.queueLightingLevels(network, reported, levels)
+
+	def requestSecurityStatus(self, network):
 		self.logger.info("requesting initial security status")
 		# request 1 represents zones up to 32, 2 provides 33-80
-		for request in ['1','2']:
-			self.writeTo(self.connection, "security status_request "+self.cbusNetwork+"/208 "+request+"\r\n")
-			self.readUntil(self.connection, "200 OK:.*")
-
-	def readUntil(self, connection, str, timeout=1):
-		try:
-			return connection.read_until(str, timeout)
-		except EOFError:
-			self.logger.warn("lost connection to c-gate. attempting to reconnect")
-			if self.loadConnections(self.cgateLocation):
-				self.getReadyState()
-				return ""
-
-	def writeTo(self, connection, str):
-		connection.write(str.encode('latin-1'))
+		results = [network.send("security status_request "+network.number+"/208 "+request) for request in ['1','2']]
+		for result in results:
+			if not result.wait():
+				self.logger.warn("security status request failed")
+
+	def queueRamp(self, device, actionString, level):
+		# brightness changes arrive in bursts (slider drags, repeated brighten/dim).  the first change for a group
+		# starts the window and any changes within it replace the queued level, so at most one ramp per window is sent
+		# to the bus and it is always the latest target
+		if self.rampWindow <= 0:
+			self.rampChannel(device, actionString, level)
+			return
+		with self.queuedRampLock:
+			queued = self.queuedRamps.get(device.address)
+			if queued:
+				self.metrics.count("ramps coalesced")
+				handle = queued[3]
+			else:
+				handle = self.scheduler.schedule(self.rampWindow, self.sendQueuedRamp, device.address)
+			self.queuedRamps[device.address] = (device, actionString, level, handle)
+			self.pendingLevels[device.address] = int(level)
+		self.applyOptimisticState(device, int(level) > 0, level)
+
+	def sendQueuedRamp(self, address):
+		with self.queuedRampLock:
+			queued = self.queuedRamps.pop(address, None)
+		if queued:
+			self.rampChannel(queued[0], queued[1], queued[2])
+
+	def cancelQueuedRamp(self, device):
+		# a queued ramp must not overwrite a command sent after it
+		with self.queuedRampLock:
+			queued = self.queuedRamps.pop(device.address, None)
+			if queued:
+				self.scheduler.cancel(queued[3])
+				if self.pendingLevels.get(device.address) == int(queued[2]):
+					del self.pendingLevels[device.address]
 
 	def rampChannel(self, device, actionString, level, timer=0):
-		self.writeTo(self.connection,"ramp "+self.cbusNetwork+"/56/"+device.pluginProps['unqualifiedAddress']+" "+level+" "+str(timer)+"s\r\n")
-		result = self.readUntil(self.connection, "200 OK:.*")
-		if result == '':
+		# the ramp is sent asynchronously.  the device is updated once c-gate acknowledges it in rampChannelComplete
+		network = self.deviceNetwork(device)
+		if network == None:
+			return
+		self.cancelQueuedRamp(device)
+		self.pendingLevels[device.address] = int(level)
+		self.applyOptimisticState(device, int(level) > 0, level)
+		network.send("ramp "+network.number+"/56/"+device.pluginProps['unqualifiedAddress']+" "+level+" "+str(timer)+"s",
+			lambda result: self.rampChannelComplete(result, device, actionString, level, timer), key=device.address)
+
+	def rampChannelComplete(self, result, device, actionString, level, timer):
+		self.metrics.record("command ramp", time.time() - result.sent)
+		if self.pendingLevels.get(device.address) == int(level):
+			del self.pendingLevels[device.address]
+		if not result.ok:
 			self.logger.warn("send \"%s\" %s to %d failed" % (device.name, actionString, int(level)))
+			self.rollbackState(device.address)
 		else:
 			if timer > 0:
 				self.logger.info("sent \"%s\" %s to %d over %d seconds" % (device.name, actionString, int(level), timer))
@@ -359,20 +1713,126 @@ class Plugin(indigo.PluginBase):
 				self.updateIndigoLightingState(device, True, level)
 			else:
 				self.updateIndigoLightingState(device, False, level)
-				device.updateStateOnServer("onOffState", False)
 
-	def readLightSensors(self):
-		device = None
+	def switchChannel(self, device, actionString, onState):
+		network = self.deviceNetwork(device)
+		if network == None:
+			return
+		self.cancelQueuedRamp(device)
+		self.applyOptimisticState(device, onState, None)
+		command = "off "
+		if onState:
+			command = "on "
+		network.send(command+network.number+"/56/"+device.pluginProps['unqualifiedAddress'],
+			lambda result: self.switchChannelComplete(result, device, actionString, onState), key=device.address)
+
+	def switchChannelComplete(self, result, device, actionString, onState):
+		self.metrics.record("command on/off", time.time() - result.sent)
+		if not result.ok:
+			self.logger.warn("send \"%s\" %s failed" % (device.name, actionString))
+			self.rollbackState(device.address)
+		else:
+			self.logger.info("sent \"%s\" %s" % (device.name, actionString))
+			self.updateIndigoLightingState(device, onState, None)
+
+	def applyOptimisticState(self, device, onState, level):
+		if not self.optimisticUpdates:
+			return
+		with self.unconfirmedLock:
+			unconfirmed = self.unconfirmedStates.get(device.address)
+			if unconfirmed:
+				# roll back to the last confirmed state, not to an earlier optimistic one
+				self.scheduler.cancel(unconfirmed['timeout'])
+				previous = unconfirmed['previous']
+			else:
+				previous = [{'key': 'onOffState', 'value': self.currentState(device, 'onOffState', device.onState)}]
+				if device.deviceTypeId == "cbusDimmer":
+					previous.append({'key': 'brightnessLevel', 'value': self.currentState(device, 'brightnessLevel', device.brightness)})
+			unconfirmed = {'device': device, 'previous': previous}
+			unconfirmed['timeout'] = self.scheduler.schedule(self.optimisticTimeout, self.confirmationTimedOut, device.address, unconfirmed)
+			self.unconfirmedStates[device.address] = unconfirmed
+		self.updateIndigoLightingState(device, onState, level)
+
+	def confirmState(self, address):
+		# c-gate has reported the group on the monitor port so its state is no longer a guess
+		if self.unconfirmedStates:
+			with self.unconfirmedLock:
+				unconfirmed = self.unconfirmedStates.pop(address, None)
+				if unconfirmed:
+					self.scheduler.cancel(unconfirmed['timeout'])
+
+	def confirmationTimedOut(self, address, unconfirmed):
+		if self.unconfirmedStates.get(address) is unconfirmed:
+			self.logger.warn("no confirmation of \"%s\" from c-bus. restoring its previous state" % (unconfirmed['device'].name))
+			self.rollbackState(address)
+
+	def rollbackState(self, address):
+		with self.unconfirmedLock:
+			unconfirmed = self.unconfirmedStates.pop(address, None)
+			if unconfirmed:
+				self.scheduler.cancel(unconfirmed['timeout'])
+		if unconfirmed:
+			self.metrics.count("optimistic rollbacks")
+			self.updateDeviceStates(unconfirmed['device'], unconfirmed['previous'])
+
+	def logCommandResult(self, result):
+		if not result.ok:
+			self.logger.warn("c-gate command failed: %s" % (result.command))
+
+	def readLightSensors(self, generation):
+		# runs on the scheduler.  every sensor which is due is queried in a single pipelined batch and the replies are
+		# handled by lightSensorRead as they arrive.  the next run is scheduled for whenever the next sensor is due
+		with self.lightSensorLock:
+			if generation != self.lightSensorGeneration:
+				# replaced by an earlier timer after this one had already started
+				return
+			self.lightSensorTimer = None
+		now = time.time()
+		nextDue = now + self.lightSensorMaximumInterval
 		for dev in indigo.devices.iter("self.cbusLightSensor"):
-			self.writeTo(self.thread_connection, "get "+dev.address+" LightLevel\r\n")
-			result = self.readUntil(self.thread_connection, "300.*")
-			level_split = result.split("=")
-			if len(level_split) > 1:
-				keyValueList = []
-				keyValueList.append({'key':'sensorValue', 'value':int(level_split[-1])})
-				dev.updateStatesOnServer(keyValueList)
+			network = self.networkFor(dev.address)
+			if not dev.pluginProps.get("lightSensorAddress", "") or network == None or not network.validConnections:
+				# the sensor only broadcasts its level on the measurement application (or can't be reached)
+				continue
+			polling = self.lightSensorPolling.setdefault(dev.id, {'interval': self.lightSensorInterval, 'due': now})
+			if now - self.lightSensorPushed.get(dev.id, 0) < self.lightSensorMaximumInterval:
+				# the sensor is broadcasting its level so polling is only needed if the broadcasts stop
+				polling['due'] = self.lightSensorPushed[dev.id] + self.lightSensorMaximumInterval
+			elif polling['due'] <= now:
+				# don't ask again until this request has been answered (or has failed)
+				polling['due'] = now + self.lightSensorMaximumInterval
+				network.send("get "+dev.address+" LightLevel", lambda result, dev=dev: self.lightSensorRead(dev, result))
+			nextDue = min(nextDue, polling['due'])
+		self.scheduleLightSensorRead(nextDue)
+
+	def scheduleLightSensorRead(self, due):
+		# bring the next run forward if a sensor is due before it.  only one timer is ever pending
+		with self.lightSensorLock:
+			if self.lightSensorTimer == None or due < self.nextLightSensorRead:
+				if self.lightSensorTimer:
+					self.scheduler.cancel(self.lightSensorTimer)
+				self.lightSensorGeneration = self.lightSensorGeneration + 1
+				self.nextLightSensorRead = max(due, time.time() + 1)
+				self.lightSensorTimer = self.scheduler.schedule(self.nextLightSensorRead - time.time(), self.readLightSensors, self.lightSensorGeneration)
+
+	def lightSensorRead(self, dev, result):
+		polling = self.lightSensorPolling.get(dev.id)
+		if polling == None:
+			# the sensor has been deleted
+			return
+		level_split = result.text.split("=")
+		if result.ok and len(level_split) > 1:
+			# poll more often whilst the light level is changing and back off whilst it is stable
+			if self.updateDeviceStates(dev, [{'key':'sensorValue', 'value':int(level_split[-1])}]):
+				polling['interval'] = max(polling['interval'] / 2, self.lightSensorMinimumInterval)
 			else:
-				self.logger.error(dev.address+" does not appear to be a Light Sensor")
+				polling['interval'] = min(polling['interval'] * 2, self.lightSensorMaximumInterval)
+		elif result.ok:
+			self.logger.error(dev.address+" does not appear to be a Light Sensor")
+		else:
+			self.logger.warn("unable to read light level from "+dev.address)
+		polling['due'] = time.time() + polling['interval']
+		self.scheduleLightSensorRead(polling['due'])
 
 	########################################
 	# INITIALISATION FUNCTIONS
@@ -387,278 +1847,366 @@ class Plugin(indigo.PluginBase):
 			except Exception:
 				self.logger.info("updating alarm zone: "+dev.name)
 				dev = indigo.device.changeDeviceTypeId(dev, "cbusSecurityZone")
-				dev.updateStateImageOnServer(indigo.kStateImageSel.SensorOn)
+				self.updateStateImage(dev, indigo.kStateImageSel.SensorOn)
 				dev.updateStateOnServer("onOffState", value=False, uiValue="monitoring")
 
-	def generateGroupData(self, appId, groupType):
-		self.logger.info("searching for c-bus %s groups" % (groupType))
+	def generateGroupData(self, network, appId, groupType):
+		self.logger.info("searching for c-bus %s groups on network %s" % (groupType, network.number))
 		while True:
-			# use dbgetxml 254/appId to determine names/OID/address of each group
-			self.writeTo(self.connection, "dbgetxml "+self.cbusNetwork+"/"+appId+"\r\n")
-			xml = self.readUntil(self.connection, "344 End XML snippet")
-			xml = xml.replace("343-Begin XML snippet","")
-			xml = xml.replace("347-","",2)
-			xml = xml.replace("344 End XML snippet","")
-			xml = xml.replace("\n","",5)
-			xml = xml.replace("<?xml version=\"1.0\" encoding=\"utf-8\"?>","")
+			mapping = {}
+			def addGroup(group):
+				mapping[network.number+"/"+appId+"/"+group['Address']] = {'oid':group.get('OID', ""),
+										'name':group.get('TagName', group['Address']),
+										'unqualifiedAddress':group['Address'], 'level':'0'}
+			parser = GroupXmlParser(addGroup)
+			def parseLine(line):
+				# the xml document itself is carried on the 347 lines between the 343 and 344 markers
+				if line.startswith("347"):
+					parser.feed(line[4:]+"\n")
+			# use dbgetxml 254/appId to determine names/OID/address of each group.  groups are parsed as the reply streams in
+			result = network.execute("dbgetxml "+network.number+"/"+appId, timeout=30, lineCallback=parseLine)
 			try:
-				mapping = {}
-				dom = parseString(xml)
-				for group in dom.getElementsByTagName("Group"):
-					address = group.getElementsByTagName("Address")[0].childNodes[0].data
-					mapping[self.cbusNetwork+"/"+appId+"/"+address] = {'oid':group.getElementsByTagName("OID")[0].childNodes[0].data,
-											'name':group.getElementsByTagName("TagName")[0].childNodes[0].data,
-											'unqualifiedAddress':address, 'level':'0'}
+				if not result.ok:
+					raise ValueError
+				parser.close()
 				return mapping
-			except Exception:
-				self.logger.warn("c-bus %s database not yet ready. waiting 10 seconds for retry" % (groupType))
+			except (ValueError, xml.parsers.expat.ExpatError):
+				if not network.running:
+					raise self.StopThread
+				if not self.restoreCommandSessions(network):
+					self.logger.warn("c-bus %s database for network %s not yet ready. waiting 10 seconds for retry" % (groupType, network.number))
+					self.sleep(10)
+
+	def generateDeviceTypesPerGroup(self, network, lightingMap):
+		self.logger.info("searching for c-bus units")
+		while True:
+			unitMap = {}
+			# an inverted index of unqualified group address to the types of the units which support it
+			groupUnitTypes = {}
+			def parseLine(line):
+				# we are looking for two types of items.
+				# Units (to determine which objects are relays and dimmers)
+				# Groups (so we can match them to correct unit type)
+				line = line.rstrip()
+				m0 = treeUnitPattern.search(line)
+				if m0:
+					# Capture the name of the C-Bus project for later use when DLT Labelling
+					network.projectName = m0.group(1)
+					unitType = "unknown"
+					for prefix, deviceType in treeUnitTypes:
+						if m0.group(3).startswith(prefix):
+							unitType = deviceType
+					unitMap[m0.group(2)] = { 'unit':unitType, 'groups': m0.group(4).split(',') }
+					if unitType == "cbusDimmer" or unitType == "cbusRelay":
+						# switches are ignored here.  We use switches for events in updateIndigoLightingState
+						for group in unitMap[m0.group(2)]['groups']:
+							groupUnitTypes.setdefault(group, set()).add(unitType)
+					return
+				m1 = treeGroupPattern.search(line)
+				if m1 and network.number+"/56/"+m1.group(1) in lightingMap:
+					lightingMap[network.number+"/56/"+m1.group(1)]['level'] = m1.group(2)
+					lightingMap[network.number+"/56/"+m1.group(1)]['units'] = m1.group(3).split(',')
+			result = network.execute("tree "+network.number, timeout=30, lineCallback=parseLine)
+			if result.ok:
+				return (unitMap, groupUnitTypes)
+			# a partial tree would map every group to a dimmer and lose the switches which mark manual changes
+			if not network.running:
+				raise self.StopThread
+			if not self.restoreCommandSessions(network):
+				self.logger.warn("c-bus units for network %s not yet available. waiting 10 seconds for retry" % (network.number))
 				self.sleep(10)
 
-	def generateDeviceTypesPerGroup(self):
-		self.logger.info("searching for c-bus units")
-		self.writeTo(self.connection, "tree "+self.cbusNetwork+"\r\n")
-		treeStr = self.readUntil(self.connection, "320 -end-")
-		# we are looking for two types of items.
-		# Units (to determine which objects are relays and dimmers)
-		# Groups (so we can match them to correct unit type)
-		for line in StringIO.StringIO(treeStr):
-			line = line.rstrip()
-			m0 = re.match(".*(\/\/\w+)\/.*p\/(\w+).*type\=(\w+).*groups\=(.*)", line)
-			m1 = re.match(".*\/56\/(\w+).*level\=(\w+).*units\=(.*)", line)
-			if m0:
-				# Capture the name of the C-Bus project for later use when DLT Labelling
-				self.cbusProjectName = m0.group(1)
-				unitType = "unknown"
-				if re.match("DIM.*",m0.group(3)):
-					unitType = "cbusDimmer"
-				if re.match("REL.*",m0.group(3)):
-					unitType = "cbusRelay"
-				if re.match("KEY.*",m0.group(3)):
-					unitType = "cbusSwitch"
-				self.cbusUnitMap[m0.group(2)] = { 'unit':unitType, 'groups': m0.group(4).split(',') }
-			elif m1:
-				if self.cbusNetwork+"/56/"+m1.group(1) in self.cbusLightingMap:
-					self.cbusLightingMap[self.cbusNetwork+"/56/"+m1.group(1)]['level'] = m1.group(2)
-					self.cbusLightingMap[self.cbusNetwork+"/56/"+m1.group(1)]['units'] = m1.group(3).split(',')
-
-	def mapLightingDevices(self):
+	def mapLightingDevices(self, lightingMap, groupUnitTypes):
 		self.logger.info("mapping c-bus lighting groups to channel types")
-		# for each item in lighting map, find the units that supports it.  if not found set to relay
-		# if found on multiple units then default to relay
-		# then create the device
-		for group in self.cbusLightingMap.keys():
-			for unit in self.cbusUnitMap:
-				if self.cbusUnitMap[unit]['unit'] == "unknown" or self.cbusUnitMap[unit]['unit'] == "cbusSwitch":
-					# ignore devices in the c-bus network which have not been mapped or are switches.  We use switches for events in updateIndigoLightingState
-					continue
-				if self.cbusLightingMap[group]['unqualifiedAddress'] in self.cbusUnitMap[unit]['groups']:
-					# we need to account for all unit groups
-					if 'type' not in self.cbusLightingMap[group]:
-						self.cbusLightingMap[group]['type'] = self.cbusUnitMap[unit]['unit']
-					else:
-						# we've already matched before.	 if unit is relay and value is dimmer replace, otherwise do nothing
-						# if a group applies across multiple unit types then we need to apply the lowest common feature set to it
-						# for all unit groups that is typically on/off
-						if self.cbusLightingMap[group]['type'] == "dimmer" and self.cbusUnitMap[unit]['unit'] == "relay":
-							self.cbusLightingMap[group]['type'] = self.cbusUnitMap[unit]['unit']
-
-			# if we havent seen a match then really we should set to relay type however for those of us using
-			# MRA like functionality (e.g. audio controls etc) then dimming functionality is required.	Should
-			# make this a configurable option?
-			if 'type' not in self.cbusLightingMap[group]:
-				self.cbusLightingMap[group]['type'] = "cbusDimmer"
-
-	def createLightingDevices(self):
+		for group in lightingMap.values():
+			unitTypes = groupUnitTypes.get(group['unqualifiedAddress'], ())
+			# if a group applies across multiple unit types then we need to apply the lowest common feature set to it
+			# for all unit groups that is typically on/off
+			if "cbusRelay" in unitTypes:
+				group['type'] = "cbusRelay"
+			else:
+				# if we havent seen a match then really we should set to relay type however for those of us using
+				# MRA like functionality (e.g. audio controls etc) then dimming functionality is required.	Should
+				# make this a configurable option?
+				group['type'] = "cbusDimmer"
+
+	def createLightingDevices(self, network, queried):
+		# reconcile the network's c-bus lighting model with indigo in one pass.  groups without a device are created,
+		# devices whose state differs from the model are updated and everything else is left alone.  groups reported on
+		# the monitor port since the levels were queried already have a newer level so they are left alone too
 		self.logger.info("creating c-bus lighting devices in Indigo")
-		for group in self.cbusLightingMap.keys():
-			device = None
-			for dev in indigo.devices.iter("self"):
-				# search for c-bus devices to find a match for this address. would be nicer to search by address.
-				if dev.address == group:
-					device = indigo.devices[dev.name]
-			
+		lightingMap = network.lightingMap
+		created = []
+		existing = []
+		for group in lightingMap:
+			device = self.findDevice(group)
 			if device == None:
-				device = indigo.device.create(protocol=indigo.kProtocol.Plugin,
-					address=group,
-					name=self.cbusLightingMap[group]['name'],
-					description=self.cbusLightingMap[group]['name'],
-					pluginId="uk.co.l1fe.indigoplugin.C-Bus",
-					deviceTypeId=self.cbusLightingMap[group]['type'],
-					props={"OID":self.cbusLightingMap[group]['oid'],"unqualifiedAddress":self.cbusLightingMap[group]['unqualifiedAddress']})
-			
-			onState = True
-			if int(self.cbusLightingMap[group]['level']) == 0:
-				onState = False
-			if self.cbusLightingMap[group]['type'] == "cbusDimmer":
-				self.updateIndigoLightingState(device, onState,self. cbusLightingMap[group]['level'])
+				created.append(group)
 			else:
-				self.updateIndigoLightingState(device, onState, None)
+				existing.append((group, device))
+		for group in created:
+			device = self.createDevice(protocol=indigo.kProtocol.Plugin,
+				address=group,
+				name=lightingMap[group]['name'],
+				description=lightingMap[group]['name'],
+				pluginId="uk.co.l1fe.indigoplugin.C-Bus",
+				deviceTypeId=lightingMap[group]['type'],
+				props={"OID":lightingMap[group]['oid'],"unqualifiedAddress":lightingMap[group]['unqualifiedAddress']})
+			self.addDeviceAddress(device)
+			self.updateLightingLevel(network, device, group)
+		updated = 0
+		for group, device in existing:
+			if network.lightingReported.get(group, 0) >= queried:
+				continue
+			if self.updateLightingLevel(network, device, group):
+				updated = updated + 1
+		self.logger.info("c-bus network %s lighting devices: %d created, %d updated, %d unchanged" % (network.number, len(created), updated, len(existing) - updated))
+
+	def updateLightingLevel(self, network, device, group):
+		onState = True
+		if int(network.lightingMap[group]['level']) == 0:
+			onState = False
+		if network.lightingMap[group]['type'] == "cbusDimmer":
+			return self.updateIndigoLightingState(device, onState, network.lightingMap[group]['level'])
+		else:
+			return self.updateIndigoLightingState(device, onState, None)
+
+	def projectCachePath(self):
+		return os.path.join(indigo.server.getInstallFolderPath(), "Preferences", "Plugins", self.pluginId+".project.json")
+
+	def loadProjectCache(self, network):
+		# restore the project model for the network from the cache file.  returns False if there is no usable cache,
+		# in which case the model must be built from c-gate before devices can be created
+		try:
+			with open(self.projectCachePath()) as cacheFile:
+				cache = json.load(cacheFile)
+			if cache.get('version') != projectCacheVersion:
+				return False
+			project = cache['networks'][network.location+"/"+network.number]
+			network.projectName = project['project']
+			network.lightingMap = project['lighting']
+			network.unitMap = project['units']
+			network.securityMap = project['security']
+			self.logger.info("loaded c-bus project %s network %s from cache" % (network.projectName, network.number))
+			return True
+		except (IOError, ValueError, KeyError):
+			return False
 
-	def createSecurityPanel(self):
+	def saveProjectCache(self, network):
+		# networks refresh in parallel so the read, update and write of the shared cache file is serialised
+		with self.projectCacheLock:
+			cache = {'version': projectCacheVersion, 'networks': {}}
+			try:
+				with open(self.projectCachePath()) as cacheFile:
+					existing = json.load(cacheFile)
+				if existing.get('version') == projectCacheVersion:
+					cache = existing
+			except (IOError, ValueError):
+				pass
+			cache['networks'][network.location+"/"+network.number] = {'project': network.projectName,
+				'lighting': network.lightingMap, 'units': network.unitMap, 'security': network.securityMap}
+			try:
+				# write to a temporary file first so a partially written cache is never read back
+				with open(self.projectCachePath()+".tmp", "w") as cacheFile:
+					json.dump(cache, cacheFile)
+				os.rename(self.projectCachePath()+".tmp", self.projectCachePath())
+			except (IOError, OSError):
+				self.logger.warn("unable to save c-bus project cache")
+
+	def createSecurityPanel(self, network):
 		self.logger.info("creating c-bus security panel device in Indigo")
-		# I currently presume there is only one c-bus enabled alarm panel.
-		panel = None
-		for dev in indigo.devices.iter("self.cbusSecurityAlarmPanel"):
-			if dev.address == "254/208":
-				panel = indigo.devices[dev.name]
+		panel = self.findDevice(network.number+"/208")
 		if panel == None:
-			panel = indigo.device.create(protocol=indigo.kProtocol.Plugin,
-				address="254/208",
+			panel = self.createDevice(protocol=indigo.kProtocol.Plugin,
+				address=network.number+"/208",
 				name="Alarm Panel",
 				description="C-Bus Enabled Alarm Panel",
 				pluginId="uk.co.l1fe.indigoplugin.C-Bus",
 				deviceTypeId="cbusSecurityAlarmPanel")
+			self.addDeviceAddress(panel)
 			self.updateIndigoSecurityState(panel, "mainsState", "ok")
 			self.updateIndigoSecurityState(panel, "batteryState", "ok")
 
-	def createSecurityZones(self):
+	def createSecurityZones(self, network):
 		self.logger.info("creating c-bus security zones in Indigo")
-		for group in self.cbusSecurityMap.keys():
-			device = None
-			for dev in indigo.devices.iter("self.cbusSecurityZone"):
-				if dev.address == group:
-					device = indigo.devices[dev.name]
-			if device == None:
-				device = indigo.device.create(protocol=indigo.kProtocol.Plugin,
-					address=group,
-					name=self.cbusSecurityMap[group]['name'],
-					description=self.cbusSecurityMap[group]['name'],
-					pluginId="uk.co.l1fe.indigoplugin.C-Bus",
-					deviceTypeId="cbusSecurityZone")
-				self.updateIndigoSecurityState(device, "state", "monitoring")
+		securityMap = network.securityMap
+		# zone state comes from status reports so the only difference to reconcile is zones without a device
+		created = [group for group in securityMap if self.findDevice(group) == None]
+		for group in created:
+			device = self.createDevice(protocol=indigo.kProtocol.Plugin,
+				address=group,
+				name=securityMap[group]['name'],
+				description=securityMap[group]['name'],
+				pluginId="uk.co.l1fe.indigoplugin.C-Bus",
+				deviceTypeId="cbusSecurityZone")
+			self.addDeviceAddress(device)
+			self.updateIndigoSecurityState(device, "state", "monitoring")
+		self.logger.info("c-bus security zones: %d created, %d unchanged" % (len(created), len(securityMap) - len(created)))
 
 	########################################
 	# MONITORING DISPATCH FUNCTIONS
 	########################################
 
-	def lightingRampTimerCallback(self, device, brightness, sourceunit):
-		del self.currentTimers[device]
-		self.updateIndigoLightingState(self.findDevice(device), True, brightness, sourceunit)
+	def lightingRampTimerCallback(self, event):
+		# runs on the event dispatcher (in order with other events for the group).  if the ramp has since been
+		# cancelled or replaced by another press then there is nothing to do
+		timer = self.currentTimers.get(event.address)
+		if timer == None or timer[1] is not event:
+			return
+		del self.currentTimers[event.address]
+		self.updateIndigoLightingState(self.findDevice(event.address), event.level > 0, event.level, event.sourceUnit)
 
-	def lightingRamp(self, action):
+	def lightingRamp(self, event):
 		# updated to account for ramping behaviour.	 when a user initiates a ramp c-bus will send a timed ramp
 		# message of 0 or 255 over X seconds. If the user releases their finger then an immediate ramp to level
 		# message is sent.	We'll create a timer for the initial press and cancel if the user removes their finger
 		# before the timer completes.  If the timer completes then the user has ramped to 1 or 255 manually.
-		if int(action[2]) > 0:
-			self.currentTimers[action[0]] = Timer(int(action[2]), self.lightingRampTimerCallback, [action[0], action[1], action[3]])
-			self.currentTimers[action[0]].start()
+		self.confirmState(event.address)
+		if event.rampTime > 0:
+			if event.address in self.currentTimers:
+				self.scheduler.cancel(self.currentTimers[event.address][0])
+			timer = self.scheduler.schedule(event.rampTime, self.dispatcher.dispatch, self.orderingKey(event), self.lightingRampTimerCallback, event)
+			self.currentTimers[event.address] = (timer, event)
 		else:
-			if action[0] in self.currentTimers:
-				self.currentTimers[action[0]].cancel()
-				del self.currentTimers[action[0]]
-			self.updateIndigoLightingState(self.findDevice(action[0]), True, action[1], action[3])
-
-	def lightingTerminateRamp(self, action):
-		level = action[1].split("=")[1]
-		if level == "0":
-			self.updateIndigoLightingState(self.findDevice(action[0]), False, 0, action[2])
+			if event.address in self.currentTimers:
+				self.scheduler.cancel(self.currentTimers[event.address][0])
+				del self.currentTimers[event.address]
+			self.updateIndigoLightingState(self.findDevice(event.address), event.level > 0, event.level, event.sourceUnit)
+
+	def lightingTerminateRamp(self, event):
+		self.confirmState(event.address)
+		if event.level == 0:
+			self.updateIndigoLightingState(self.findDevice(event.address), False, 0, event.sourceUnit)
 		else:
-			self.updateIndigoLightingState(self.findDevice(action[0]), True, level, action[2])
+			self.updateIndigoLightingState(self.findDevice(event.address), True, event.level, event.sourceUnit)
+
+	def lightingOn(self, event):
+		self.confirmState(event.address)
+		self.updateIndigoLightingState(self.findDevice(event.address), True, 255, event.sourceUnit)
+
+	def lightingOff(self, event):
+		self.confirmState(event.address)
+		self.updateIndigoLightingState(self.findDevice(event.address), False, 0, event.sourceUnit)
 
-	def lightingOn(self, action):
-		self.updateIndigoLightingState(self.findDevice(action[0]), True, 255, action[1])
+	def updateZoneState(self, address, state):
+		self.updateIndigoSecurityState(self.findDevice(address), "state", state)
+		# keep the zone state vector in step so the next status report is compared against the current state
+		zone = address.split("/")
+		network = self.networkFor(address)
+		if network and len(zone) == 3 and zone[2].isdigit() and 0 < int(zone[2]) <= len(network.zoneStateVector):
+			network.zoneStateVector[int(zone[2])-1] = self.zoneStateCodes.get(state)
 
-	def lightingOff(self, action):
-		self.updateIndigoLightingState(self.findDevice(action[0]), False, 0, action[1])
+	def measurementData(self, event):
+		device = self.findDevice(event.address)
+		if device and device.deviceTypeId == "cbusLightSensor":
+			self.lightSensorPushed[device.id] = time.time()
+			self.updateDeviceStates(device, [{'key':'sensorValue', 'value':event.measurement}])
 
-	def zoneUnsealed(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "triggered")
+	def zoneUnsealed(self, event):
+		self.updateZoneState(event.address, "triggered")
 
-	def zoneSealed(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "monitoring")
+	def zoneSealed(self, event):
+		self.updateZoneState(event.address, "monitoring")
 
-	def zoneOpen(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "open")
+	def zoneOpen(self, event):
+		self.updateZoneState(event.address, "open")
 
-	def zoneShort(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "short")
+	def zoneShort(self, event):
+		self.updateZoneState(event.address, "short")
 
-	def zoneIsolated(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "isolated")
+	def zoneIsolated(self, event):
+		self.updateZoneState(event.address, "isolated")
 
-	def zoneArmNotReady(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "notReady")
+	def zoneArmNotReady(self, event):
+		self.updateZoneState(event.address, "notReady")
 
-	def panelArmReady(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "armReady")
+	def panelArmReady(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "armReady")
 
-	def panelSystemArmed(self, action):
-		if action[1] in self.alarmArmedStates:
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "armed")
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", self.alarmArmedStates[action[1]])
+	def panelSystemArmed(self, event):
+		if event.values[0] in self.alarmArmedStates:
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", "armed")
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", self.alarmArmedStates[event.values[0]])
 
-	def panelSystemDisarmed(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "disarmed")
+	def panelSystemDisarmed(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "disarmed")
 
-	def panelExitDelay(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "exitDelay")
+	def panelExitDelay(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "exitDelay")
 
-	def panelEntryDelay(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "entryDelay")
+	def panelEntryDelay(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "entryDelay")
 
-	def panelAlarmOn(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "alarmActivated")
+	def panelAlarmOn(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "alarmActivated")
 
-	def panelAlarmType(self, action):
+	def panelAlarmType(self, event):
 		# as per: http://www3.clipsal.com/cis/downloads/Toolkit/CGateServerGuide_1_0.pdf
 		# 1 = intruder, 2 = line cut, 3 = arm failed, 4 = fire, 5 = gas
 		# we ignore all other types at this time.  We would already have raised a generic alarm
-		if action[1] in self.alarmTypes:
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", self.alarmTypes[action[1]])
+		if event.values[0] in self.alarmTypes:
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", self.alarmTypes[event.values[0]])
 
-	def panelAlarmOff(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "alarmDisabled")
+	def panelAlarmOff(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "alarmDisabled")
 		# Once we have cleared the current alarm let's re-sync back to the state of the panel
-		self.requestSecurityStatus()
+		network = self.networkFor(event.address)
+		if network:
+			self.requestSecurityStatus(network)
 
-	def panelTamperOn(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "alarmTamperActivated")
+	def panelTamperOn(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "alarmTamperActivated")
 
-	def panelTamperOff(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "alarmTamperCleared")
+	def panelTamperOff(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "alarmTamperCleared")
 
-	def panelPanicActivated(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "panicActivated")
+	def panelPanicActivated(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "panicActivated")
 
-	def panelPanicCleared(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "panicCleared")
+	def panelPanicCleared(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "state", "panicCleared")
 
-	def panelBatteryCharging(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "batteryState", "charging")
+	def panelBatteryCharging(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "batteryState", "charging")
 
-	def panelLowBatteryDetected(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "batteryState", "low")
+	def panelLowBatteryDetected(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "batteryState", "low")
 
-	def panelLowBatteryCorrected(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "batteryState", "batteryOK")
+	def panelLowBatteryCorrected(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "batteryState", "batteryOK")
 
-	def panelMainsFailure(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "mainsState", "failure")
+	def panelMainsFailure(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "mainsState", "failure")
 
-	def panelMainsRestored(self, action):
-		self.updateIndigoSecurityState(self.findDevice(action[0]), "mainsState", "mainsOK")
+	def panelMainsRestored(self, event):
+		self.updateIndigoSecurityState(self.findDevice(event.address), "mainsState", "mainsOK")
 
 	# in status report 1 the first value is the alarm state 0 = disarmed
 	# second value = tamper state
 	# third value = panic state
 	# all other values represet the state of each zone.	 0 = sealed, 1 = unsealed, 3 = open, 4 = short
-	def panelStatusReportOne(self, action):
-		if action[1] in self.alarmArmedStates:
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", self.alarmArmedStates[action[1]])
-		if action[2] == "1":
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "alarmTamperActivated")
-		if action[3] == "1":
-			self.updateIndigoSecurityState(self.findDevice(action[0]), "state", "panicActivated")
-		for index, value in enumerate(action[3:]):
-			zone = self.findDevice(self.cbusNetwork+"/208/"+str(index+1))
-			if zone and value in self.zoneStates:
-				self.updateIndigoSecurityState(zone, "state", self.zoneStates[value])
+	def panelStatusReportOne(self, event):
+		if event.values[0] in self.alarmArmedStates:
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", self.alarmArmedStates[event.values[0]])
+		if event.values[1] == "1":
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", "alarmTamperActivated")
+		if event.values[2] == "1":
+			self.updateIndigoSecurityState(self.findDevice(event.address), "state", "panicActivated")
+		self.applyZoneReport(self.networkFor(event.address), 1, event.values[3:])
 
 	# all values in status report 2 represent zones 33 through 80
-	def panelStatusReportTwo(self, action):
-		for index, value in enumerate(action[1:]):
-			zone = self.findDevice(self.cbusNetwork+"/208/"+str(index+33))
+	def panelStatusReportTwo(self, event):
+		self.applyZoneReport(self.networkFor(event.address), 33, event.values)
+
+	def applyZoneReport(self, network, firstZone, values):
+		# only zones whose value differs from the network's zone state vector are looked up and updated
+		if network == None:
+			return
+		for index, value in enumerate(values[:len(network.zoneStateVector)-firstZone+1]):
+			if network.zoneStateVector[firstZone+index-1] == value:
+				continue
+			network.zoneStateVector[firstZone+index-1] = value
+			zone = self.findDevice(network.number+"/208/"+str(firstZone+index))
 			if zone and value in self.zoneStates:
 				self.updateIndigoSecurityState(zone, "state", self.zoneStates[value])
 
@@ -675,78 +2223,73 @@ class Plugin(indigo.PluginBase):
 			# Reloading the device state ensures the device gives us the absolute latest status following rampChannel updating
 			# the device.  We now ignore if onState isT rue irrelevant of level.  This might break some use-cases, e.g. using
 			# turn On to ramp to max if the channel is already at a designated ramp level
-			latest_dev = indigo.devices[dev.id]
-			if latest_dev.onState == False:
-				self.writeTo(self.connection,"on "+self.cbusNetwork+"/56/"+dev.pluginProps['unqualifiedAddress']+"\r\n")
-				result = self.readUntil(self.connection, "200 OK:.*")
-				if result == '':
-					self.logger.warn("send \"%s\" %s failed" % (dev.name, "on"))
-				else:
-					self.logger.info("sent \"%s\" %s" % (dev.name, "on"))
-					self.updateIndigoLightingState(dev, True, None)
+			# Ramps are acknowledged asynchronously so a ramp still in flight (or queued) also counts as the latest status.
+			# Otherwise the last state we wrote for the device is used rather than reloading it from the server.
+			if dev.address in self.pendingLevels:
+				onState = self.pendingLevels[dev.address] > 0
+			else:
+				onState = self.currentState(dev, 'onOffState', dev.onState)
+			if onState == False:
+				self.switchChannel(dev, "on", True)
 			else:
 				self.logger.info("\"%s\" already on" % (dev.name))
 
 		###### TURN OFF ######
 		elif action.deviceAction == indigo.kDeviceAction.TurnOff:
 			# Command hardware module (dev) to turn OFF here:
-			
-			self.writeTo(self.connection,"off "+self.cbusNetwork+"/56/"+dev.pluginProps['unqualifiedAddress']+"\r\n")
-			result = self.readUntil(self.connection, "200 OK:.*")
-			if result == '':
-				self.logger.warn("send \"%s\" %s failed" % (dev.name, "off"))
-			else:
-				self.logger.info("sent \"%s\" %s" % (dev.name, "off"))
-				self.updateIndigoLightingState(dev, False, None)
+			self.switchChannel(dev, "off", False)
 
 		###### TOGGLE ######
 		elif action.deviceAction == indigo.kDeviceAction.Toggle:
 			# Command hardware module (dev) to toggle here:
 			newOnState = not dev.onState
-			
-			if newOnState:
-				self.writeTo(self.connection,"on "+self.cbusNetwork+"/56/"+dev.pluginProps['unqualifiedAddress']+"\r\n")
-			else:
-				self.writeTo(self.connection,"off "+self.cbusNetwork+"/56/"+dev.pluginProps['unqualifiedAddress']+"\r\n")
-			result = self.readUntil(self.connection, "200 OK:.*")
-			
-			if result == '':
-				self.logger.warn("send \"%s\" %s failed" % (dev.name, "toggle"))
-			else:
-				self.logger.info("sent \"%s\" %s" % (dev.name, "toggle"))
-				self.updateIndigoLightingState(dev, newOnState, None)
+			self.switchChannel(dev, "toggle", newOnState)
 
 		###### SET BRIGHTNESS ######
 		elif action.deviceAction == indigo.kDeviceAction.SetBrightness:
 			# Command hardware module (dev) to set brightness here:
-			self.rampChannel(dev, "set brightness", self.valueFromIndigo(action.actionValue))
+			self.queueRamp(dev, "set brightness", self.valueFromIndigo(action.actionValue))
 
 		###### BRIGHTEN BY ######
 		elif action.deviceAction == indigo.kDeviceAction.BrightenBy:
 			# Command hardware module (dev) to do a relative brighten here:
 			
-			newBrightness = dev.brightness + action.actionValue
+			newBrightness = self.targetBrightness(dev) + action.actionValue
 			if newBrightness > 100:
 				newBrightness = 100
 			
-			self.rampChannel(dev, "brighten", self.valueFromIndigo(newBrightness))
+			self.queueRamp(dev, "brighten", self.valueFromIndigo(newBrightness))
 
 		###### DIM BY ######
 		elif action.deviceAction == indigo.kDeviceAction.DimBy:
 			# Command hardware module (dev) to do a relative dim here:
 			
-			newBrightness = dev.brightness - action.actionValue
+			newBrightness = self.targetBrightness(dev) - action.actionValue
 			if newBrightness < 0:
 				newBrightness = 0
 			
-			self.rampChannel(dev, "dim", self.valueFromIndigo(newBrightness))
+			self.queueRamp(dev, "dim", self.valueFromIndigo(newBrightness))
 
 		###### STATUS REQUEST ######
 		elif action.deviceAction == indigo.kDeviceAction.RequestStatus:
-			# Query hardware module (dev) for its current states here:
-			# ** IMPLEMENT ME **
+			# requests arriving together (e.g. from homekit) are merged into a single bulk query
+			self.requestLightingStatus(dev)
 			self.logger.info(u"sent \"%s\" %s" % (dev.name, "status request"))
 
+	def currentState(self, dev, key, default):
+		# the last value written for a device state, see updateDeviceStates
+		with self.shadowLock:
+			shadow = self.shadowStates.get(dev.id, {}).get(key)
+		if shadow == None:
+			return default
+		return shadow[0]
+
+	def targetBrightness(self, dev):
+		# relative changes build on the level still to be sent (or acknowledged) so repeated brighten/dim actions add up
+		if dev.address in self.pendingLevels:
+			return self.valueToIndigo(self.pendingLevels[dev.address])
+		return self.currentState(dev, 'brightnessLevel', dev.brightness)
+
 	########################################
 	# ACTION CALLBACKS
 	########################################
@@ -756,9 +2299,9 @@ class Plugin(indigo.PluginBase):
 			self.logger.warn("timed ramp: no c-bus group, timer or level provided.")
 		else:
 			try:
-				for dev in indigo.devices.iter("self"):
-					if dev.address == action.props.get("cbusGroup",""):
-						self.rampChannel(dev, "ramp", self.valueFromIndigo(int(action.props.get("level",""))), int(action.props.get("numberOfSeconds")))
+				dev = self.findDevice(action.props.get("cbusGroup",""))
+				if dev:
+					self.rampChannel(dev, "ramp", self.valueFromIndigo(int(action.props.get("level",""))), int(action.props.get("numberOfSeconds")))
 			except TypeError:
 				self.logger.warn("timed ramp: level or timer not a valid integer")
 
@@ -766,21 +2309,21 @@ class Plugin(indigo.PluginBase):
 		if not action.props.get("cbusGroup",""):
 			self.logger.warn("terminate ramp: No c-bus group provided.")
 		else:
-			for dev in indigo.devices.iter("self"):
-				if dev.address == action.props.get("cbusGroup",""):
-					self.logger.info("terminate ramp \"%s\"" % (dev.name))
-					self.writeTo(self.connection,"terminateramp "+action.props.get("cbusGroup","")+"\r\n")
+			dev = self.findDevice(action.props.get("cbusGroup",""))
+			network = self.deviceNetwork(dev) if dev else None
+			if network:
+				self.logger.info("terminate ramp \"%s\"" % (dev.name))
+				network.send("terminateramp "+action.props.get("cbusGroup",""), self.logCommandResult, key=dev.address)
 
 	def updateDLTLabel(self, action, dev):
 		if not action.props.get("cbusGroup",""):
 			self.logger.warn("dlt label: no c-bus group provided.")
 		else:
 			# Get name of the group for logging purposes
-			devAddr = self.cbusNetwork+"/56"+action.props.get("cbusGroup","")
 			devName = ""
-			for dev in indigo.devices.iter("self"):
-				if dev.address == devAddr:
-					devName = dev.name
+			dev = self.findDevice(action.props.get("cbusGroup",""))
+			if dev:
+				devName = dev.name
 			if not action.props.get("dltLabel",""):
 				self.logger.warn("dlt label: no label provided.")
 			else:
@@ -788,24 +2331,28 @@ class Plugin(indigo.PluginBase):
 				label = self.generateLabel(action.props.get("dltLabel",""))
 				if len(label) > 9:
 					self.logger.warn("dlt label is too long (<=9 chars): \"%s\" \"%s\"" % (devName, label))
-				if action.props.get("cbusGroup","") and label and len(label) <= 9:
+				network = self.networkFor(action.props.get("cbusGroup",""))
+				if network and label and len(label) <= 9:
 					self.logger.info("dlt label update \"%s\" \"%s\"" % (devName, label))
-					self.writeTo(self.connection, "lighting label "+self.cbusProjectName+"/"+self.cbusNetwork+"/56 1 "+ action.props.get("cbusGroup","").split("/")[2] +" - 0 "+label.encode("hex")+"\r\n")
+					network.send("lighting label "+network.projectName+"/"+network.number+"/56 1 "+ action.props.get("cbusGroup","").split("/")[2] +" - 0 "+label.encode("hex"), self.logCommandResult)
 
 	def cbusGroupList(self, filter="", valuesDict=None, typeId="", targetId=0):
 		# used by DLT labelling action.
 		groups = []
-		for group in self.cbusLightingMap.keys():
-			groups.append([group, self.cbusLightingMap[group]['name']])
+		for network in self.networks.values():
+			for group in network.lightingMap.keys():
+				groups.append([group, network.lightingMap[group]['name']])
 		return sorted(groups, key=lambda x: x[1])
 
 	def sendTime(self, action, dev):
 		self.logger.info("updating c-bus time")
-		self.writeTo(self.connection, "clock time "+self.cbusNetwork+"/223 "+strftime("%H:%M:%S")+"\r\n")
+		for network in self.networks.values():
+			network.send("clock time "+network.number+"/223 "+strftime("%H:%M:%S"), self.logCommandResult)
 
 	def sendDate(self, action, dev):
 		self.logger.info("updating c-bus date")
-		self.writeTo(self.connection, "clock date "+self.cbusNetwork+"/223 "+strftime("%Y-%m-%d")+"\r\n")
+		for network in self.networks.values():
+			network.send("clock date "+network.number+"/223 "+strftime("%Y-%m-%d"), self.logCommandResult)
 
 	########################################
 	# MISC FUNCTIONS
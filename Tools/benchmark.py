@@ -0,0 +1,349 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+# benchmarks of the plugin with indigo.py standing in for indigo.  the end to end benchmarks run the plugin against
+# cgate_simulator.py.  for each project size the simulator is started on this machine and the plugin is measured in a
+# process of its own so its memory isn't mixed up with the simulator's or with other sizes:
+#
+#   startup        seconds from startup() until every lighting device has been created, and from startup() with
+#                  the project cache until the network is connected
+#   latency        round trip of single on commands and of an off command to every group sent at once
+#   throughput     monitor events handled per second during a burst of random lighting changes
+#   memory         resident size of the plugin process once started and after the burst
+#   networks       the same with the groups on each of several networks (254 and 253 unless --networks is given) on
+#                  the one c-gate
+#
+# the others time a single part of the plugin in this process:
+#
+#   parser         monitor lines parsed per second, using the lines of a recorded trace (traces/simulator.trace.gz
+#                  unless --trace is given)
+#   lookup         microseconds for findDevice to find a device from an event's address, with 100, 1000 and 10000
+#                  devices.  the cost should not grow with the number of devices
+#   dbgetxml       milliseconds for generateGroupData to parse c-gate's dbgetxml reply for 1000, 5000 and 20000
+#                  lighting groups
+#   tree           milliseconds to parse c-gate's reply to tree and map each lighting group to a channel type, for
+#                  projects of 100, 500 and 1000 units
+#
+#   python benchmark.py
+#   python benchmark.py --sizes 500 --ipc-latency 1
+#   python benchmark.py --benchmarks parser --trace storm.trace.gz
+#
+# results are saved to benchmark_results.json and compared with the results saved last time.  metrics which are worse
+# by more than the tolerance are reported as regressions and the exit status is 1.  the simulator listens on c-gate's
+# ports (20023 and 20025) so c-gate must not be running on this machine
+#
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import platform
+import optparse
+import subprocess
+import collections
+
+import indigo
+import cgate_simulator
+
+toolsFolder = os.path.dirname(os.path.abspath(__file__))
+pluginId = "uk.co.l1fe.indigoplugin.C-Bus"
+
+def residentMemory():
+	# megabytes
+	try:
+		with open("/proc/self/status") as status:
+			for line in status:
+				if line.startswith("VmRSS:"):
+					return int(line.split()[1]) / 1024.0
+	except IOError:
+		pass
+	import resource
+	# the peak rather than the current size.  kilobytes on linux, bytes on macos
+	usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		return usage / (1024.0 * 1024.0)
+	return usage / 1024.0
+
+def waitFor(condition, timeout, what):
+	deadline = time.time() + timeout
+	while not condition():
+		if time.time() > deadline:
+			raise RuntimeError("timed out waiting for "+what)
+		time.sleep(0.01)
+
+def percentile(samples, fraction):
+	ordered = sorted(samples)
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def idle(dispatcher):
+	# every dispatched event has been handled (or merged into a later one)
+	stats = dispatcher.stats()
+	return stats['depth'] == 0 and stats['handled'] + stats['merged'] == stats['dispatched']
+
+def listening(port):
+	try:
+		socket.create_connection(("127.0.0.1", port), 1).close()
+		return True
+	except socket.error:
+		return False
+
+def startSimulator(groups, networks):
+	if listening(20023) or listening(20025):
+		raise RuntimeError("c-gate (or another simulator) is already running on this machine")
+	simulator = subprocess.Popen([sys.executable, os.path.join(toolsFolder, "cgate_simulator.py"), "--bind", "127.0.0.1", "--groups", str(groups),
+		"--networks", ",".join(networks)])
+	try:
+		waitFor(lambda: listening(20023) and listening(20025), 30, "the simulator")
+	except RuntimeError:
+		simulator.kill()
+		raise
+	return simulator
+
+def measure(groups, events, networks):
+	# runs in its own process with the simulator already started.  commands are sent to the first network
+	plugin = indigo.loadPlugin()
+	prefs = {"cgateNetworkLocation": "127.0.0.1", "cbusNetwork": ",".join(networks), "cgateSessionPoolSize": 3}
+	results = collections.OrderedDict()
+
+	cbus = plugin.Plugin(pluginId, "C-Bus", "benchmark", prefs)
+	started = time.time()
+	cbus.startup()
+	network = cbus.networks[networks[0]]
+	waitFor(lambda: len(indigo.devices) >= groups * len(networks), 600, "lighting devices")
+	results["startup (s)"] = time.time() - started
+	waitFor(lambda: os.path.exists(cbus.projectCachePath()), 60, "the project cache")
+	results["memory after startup (MB)"] = residentMemory()
+
+	samples = []
+	for index in range(1000):
+		result = network.execute("on %s/56/%d" % (network.number, index % groups + 1))
+		samples.append(time.time() - result.sent)
+	results["command latency p50 (ms)"] = 1000 * percentile(samples, 0.5)
+	results["command latency p95 (ms)"] = 1000 * percentile(samples, 0.95)
+	# every group at once, pipelined over the session pool
+	started = time.time()
+	pending = [network.send("off %s/56/%d" % (network.number, group), key="%s/56/%d" % (network.number, group)) for group in range(1, groups + 1)]
+	for result in pending:
+		result.wait()
+	results["all off (ms)"] = 1000 * (time.time() - started)
+
+	# the echoes of the commands above are handled before the burst starts
+	waitFor(lambda: idle(cbus.dispatcher), 120, "command echoes")
+	dispatched = cbus.dispatcher.stats()['dispatched']
+	started = time.time()
+	network.execute("burst %d" % (events), timeout=600)
+	waitFor(lambda: cbus.dispatcher.stats()['dispatched'] - dispatched >= events and idle(cbus.dispatcher), 600, "the event burst")
+	results["event throughput (events/s)"] = events / (time.time() - started)
+	results["memory after burst (MB)"] = residentMemory()
+	cbus.stopThread = True
+	cbus.shutdown()
+
+	# devices already exist so they are online as soon as the network is connected
+	cbus = plugin.Plugin(pluginId, "C-Bus", "benchmark", prefs)
+	started = time.time()
+	cbus.startup()
+	waitFor(lambda: all([network.validConnections and network.lightingMap for network in cbus.networks.values()]), 60, "the cached project")
+	results["startup from cache (s)"] = time.time() - started
+	cbus.stopThread = True
+	cbus.shutdown()
+	return results
+
+class SimulatedNetwork(object):
+	# stands in for a plugin Network, answering commands from cgate_simulator in this process rather than over a
+	# socket.  replies are generated once so only the plugin's handling of them is timed
+
+	def __init__(self, plugin, groups):
+		self.plugin = plugin
+		self.number = "254"
+		self.running = True
+		self.simulator = cgate_simulator.Simulator([cgate_simulator.Project("HOME", self.number, groups, 0, 0)], False)
+		self.replies = {}
+
+	def execute(self, command, timeout=None, lineCallback=None):
+		if command not in self.replies:
+			self.replies[command] = self.simulator.handle(command)
+		result = self.plugin.CommandResult(command, lineCallback=lineCallback)
+		for line in self.replies[command]:
+			if lineCallback:
+				lineCallback(line)
+			else:
+				result.lines.append(line)
+		result.code = int(self.replies[command][-1][:3])
+		result.completed.set()
+		return result
+
+def fastest(function, rounds):
+	# seconds taken by the fastest of several calls, the one least disturbed by whatever else the machine is doing
+	best = None
+	for index in range(rounds):
+		started = time.time()
+		function()
+		elapsed = time.time() - started
+		if best == None or elapsed < best:
+			best = elapsed
+	return best
+
+def runSize(groups, options, networks=("254",)):
+	simulator = startSimulator(groups, networks)
+	try:
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--measure", str(groups),
+			"--events", str(options.events), "--ipc-latency", str(options.ipcLatency), "--networks", ",".join(networks)])
+	finally:
+		simulator.kill()
+		simulator.wait()
+	# the results are the last line written by the measuring process
+	return json.loads(output.strip().splitlines()[-1], object_pairs_hook=collections.OrderedDict)
+
+def endToEnd(options):
+	results = collections.OrderedDict()
+	for size in [int(size) for size in options.sizes.split(",")]:
+		results["end to end, %d groups" % (size)] = runSize(size, options)
+	return results
+
+def multipleNetworks(options):
+	# every network must become ready and have its devices created, see Plugin.getReadyState
+	networks = options.networks.split(",")
+	return collections.OrderedDict([("end to end, %d groups on each of networks %s" % (options.networkGroups, ", ".join(networks)),
+		runSize(options.networkGroups, options, networks))])
+
+def monitorParser(options):
+	plugin = indigo.loadPlugin()
+	lines = []
+	plugin.replayTrace(options.trace, lines.append)
+	def parseAll():
+		for line in lines:
+			plugin.parseMonitorLine(line)
+	results = collections.OrderedDict()
+	results["lines parsed (lines/s)"] = len(lines) / fastest(parseAll, 20)
+	return collections.OrderedDict([("monitor parser, %s" % (os.path.basename(options.trace)), results)])
+
+def deviceLookup(options):
+	plugin = indigo.loadPlugin()
+	results = collections.OrderedDict()
+	for size in [int(size) for size in options.devices.split(",")]:
+		indigo.reset()
+		addresses = []
+		for group in range(1, size + 1):
+			address = "254/56/%d" % (group)
+			indigo.device.create(address=address, name=address, pluginId=pluginId, deviceTypeId="cbusDimmer",
+				props={"unqualifiedAddress": str(group)})
+			addresses.append(address)
+		cbus = plugin.Plugin(pluginId, "C-Bus", "benchmark", {"cbusNetwork": "254"})
+		cbus.buildDeviceAddressMap()
+		# events arrive for groups all over the project, not in address order
+		addresses = [addresses[(index * 7919) % size] for index in range(10000)]
+		def findAll():
+			for address in addresses:
+				cbus.findDevice(address)
+		results["findDevice, %d devices (us)" % (size)] = 1000000 * fastest(findAll, 5) / len(addresses)
+	indigo.reset()
+	return collections.OrderedDict([("device lookup", results)])
+
+def groupXml(options):
+	plugin = indigo.loadPlugin()
+	cbus = plugin.Plugin(pluginId, "C-Bus", "benchmark", {"cbusNetwork": "254"})
+	results = collections.OrderedDict()
+	for size in [int(size) for size in options.xmlGroups.split(",")]:
+		network = SimulatedNetwork(plugin, size)
+		if len(cbus.generateGroupData(network, "56", "lighting")) != size:
+			raise RuntimeError("groups missing from the parsed dbgetxml reply")
+		results["generateGroupData, %d groups (ms)" % (size)] = 1000 * fastest(lambda: cbus.generateGroupData(network, "56", "lighting"), 5)
+	return collections.OrderedDict([("dbgetxml parse", results)])
+
+def unitTree(options):
+	plugin = indigo.loadPlugin()
+	cbus = plugin.Plugin(pluginId, "C-Bus", "benchmark", {"cbusNetwork": "254"})
+	results = collections.OrderedDict()
+	for size in [int(size) for size in options.units.split(",")]:
+		# the simulator puts eight groups on each unit, alternating between dimmers and relays, and adds a key unit
+		network = SimulatedNetwork(plugin, 8 * (size - 1))
+		lightingMap = cbus.generateGroupData(network, "56", "lighting")
+		def mapUnits():
+			unitMap, groupUnitTypes = cbus.generateDeviceTypesPerGroup(network, lightingMap)
+			cbus.mapLightingDevices(lightingMap, groupUnitTypes)
+			return unitMap
+		if len(mapUnits()) != size or len([group for group in lightingMap.values() if group['type'] == "cbusRelay"]) != 8 * ((size - 1) // 2):
+			raise RuntimeError("units or relay groups missing from the parsed tree")
+		results["tree and channel types, %d units (ms)" % (size)] = 1000 * fastest(mapUnits, 20)
+	return collections.OrderedDict([("tree parse", results)])
+
+benchmarks = collections.OrderedDict([("end-to-end", endToEnd), ("networks", multipleNetworks), ("parser", monitorParser), ("lookup", deviceLookup), ("dbgetxml", groupXml),
+	("tree", unitTree)])
+
+def higherIsBetter(metric):
+	return metric.endswith("/s)")
+
+def compare(results, previous, tolerance):
+	# prints each metric alongside its previous value and returns the number of regressions
+	regressions = 0
+	for name, metrics in results.items():
+		print name
+		for metric, value in metrics.items():
+			line = "  %-32s %12.3f" % (metric, value)
+			before = previous.get(name, {}).get(metric)
+			if before:
+				change = (value - before) / before
+				line = line + "   was %12.3f  %+6.1f%%" % (before, 100 * change)
+				if (-change if higherIsBetter(metric) else change) > tolerance:
+					line = line + "  REGRESSION"
+					regressions = regressions + 1
+			print line
+	return regressions
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--benchmarks", default=",".join(benchmarks), help="comma separated benchmarks to run: "+", ".join(benchmarks))
+	parser.add_option("--sizes", default="50,500,5000", help="comma separated numbers of lighting groups")
+	parser.add_option("--networks", default="254,253", help="comma separated networks for the networks benchmark")
+	parser.add_option("--network-groups", dest="networkGroups", type="int", default=500, help="lighting groups on each network for the networks benchmark")
+	parser.add_option("--events", type="int", default=20000, help="monitor events in the throughput burst")
+	parser.add_option("--devices", default="100,1000,10000", help="comma separated numbers of devices for the lookup benchmark")
+	parser.add_option("--xml-groups", dest="xmlGroups", default="1000,5000,20000", help="comma separated numbers of groups for the dbgetxml benchmark")
+	parser.add_option("--units", default="100,500,1000", help="comma separated numbers of units for the tree benchmark")
+	parser.add_option("--trace", default=os.path.join(toolsFolder, "traces", "simulator.trace.gz"), help="recorded traffic for the parser benchmark")
+	parser.add_option("--ipc-latency", dest="ipcLatency", type="float", default=0, help="milliseconds added to each indigo server call")
+	parser.add_option("--results", default=os.path.join(toolsFolder, "benchmark_results.json"), help="results file to compare with and update")
+	parser.add_option("--tolerance", type="float", default=0.5, help="fraction a metric may worsen by before it is a regression. timings of a few milliseconds vary run to run")
+	parser.add_option("--no-save", dest="save", action="store_false", default=True, help="compare without updating the results file")
+	parser.add_option("--measure", type="int", help=optparse.SUPPRESS_HELP)
+	options, arguments = parser.parse_args()
+	selected = options.benchmarks.split(",")
+	for name in selected:
+		if name not in benchmarks:
+			parser.error("unknown benchmark "+name)
+	logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+	indigo.ipcLatency = options.ipcLatency / 1000.0
+
+	if options.measure:
+		print json.dumps(measure(options.measure, options.events, options.networks.split(",")))
+		# the plugin's daemon threads are left running so leave without tearing them down
+		sys.stdout.flush()
+		os._exit(0)
+
+	try:
+		with open(options.results) as resultsFile:
+			saved = json.load(resultsFile, object_pairs_hook=collections.OrderedDict)
+	except IOError:
+		saved = collections.OrderedDict([('results', collections.OrderedDict())])
+	if saved.get('ipc latency (ms)', options.ipcLatency) != options.ipcLatency:
+		print "previous results were measured with an ipc latency of %sms" % (saved['ipc latency (ms)'])
+
+	results = collections.OrderedDict()
+	for name in selected:
+		results.update(benchmarks[name](options))
+	regressions = compare(results, saved['results'], options.tolerance)
+
+	if options.save:
+		# results for sizes (or benchmarks) which weren't run this time are kept
+		saved['results'].update(results)
+		saved = collections.OrderedDict([('recorded', time.strftime("%Y-%m-%d %H:%M:%S")), ('python', platform.python_version()),
+			('platform', platform.platform()), ('ipc latency (ms)', options.ipcLatency), ('results', saved['results'])])
+		with open(options.results, "w") as resultsFile:
+			json.dump(saved, resultsFile, indent=1, separators=(",", ": "))
+			resultsFile.write("\n")
+	return 1 if regressions else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
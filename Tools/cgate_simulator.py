@@ -0,0 +1,317 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+# a stand-in for a c-gate server so the plugin can be developed and load tested without c-bus hardware.  it serves
+# the command port (20023) and event monitor port (20025) for a generated project of any size.  lighting commands
+# change the simulated levels and are echoed on the monitor port, and random lighting changes can be generated at a
+# fixed rate to simulate a busy network.
+#
+#   python cgate_simulator.py --groups 500 --zones 16 --sensors 2 --event-rate 50
+#   python cgate_simulator.py --networks 254,253 --groups 100
+#
+# each network given with --networks has its own copy of the generated project, so the plugin can be run with
+# several networks on one c-gate.
+#
+# point the plugin's C-Gate Location at the machine running the simulator.  c-gate's ports are fixed in the plugin so
+# the simulator must run on a different host (or container) to any real c-gate.
+#
+# as well as the c-gate commands the simulator answers "burst <count>", which sends count random lighting events to
+# the monitor port as fast as possible before replying.  benchmark.py uses it to measure event throughput
+#
+
+import sys
+import re
+import time
+import random
+import socket
+import threading
+import optparse
+import SocketServer
+
+class Project(object):
+	# the generated c-bus project: lighting groups with their levels, the units which control them, security zones
+	# and light sensors
+
+	def __init__(self, name, network, groups, zones, sensors):
+		self.name = name
+		self.network = network
+		self.lock = threading.Lock()
+		self.levels = dict([(group, 0) for group in range(1, groups + 1)])
+		self.zones = zones
+		self.units = []
+		unit = 1
+		# a dimmer or relay channel for every group, eight channels to a unit
+		for first in range(1, groups + 1, 8):
+			unitType = "DIMDN8" if (first // 8) % 2 == 0 else "RELDN8"
+			self.units.append((unit, unitType, range(first, min(first + 8, groups + 1))))
+			unit = unit + 1
+		# a key unit which switches every group
+		self.units.append((unit, "KEYBL5", range(1, groups + 1)))
+		self.sensors = range(unit + 1, unit + 1 + sensors)
+
+	def qualify(self, address):
+		return "//"+self.name+"/"+address
+
+	def unqualify(self, address):
+		# commands may address objects with or without the //project prefix
+		if address.startswith("//"):
+			return address.split("/", 3)[3]
+		return address
+
+	def group(self, address):
+		parts = self.unqualify(address).split("/")
+		if len(parts) == 3 and parts[0] == self.network and parts[1] == "56" and parts[2].isdigit() and int(parts[2]) in self.levels:
+			return int(parts[2])
+		return None
+
+class Simulator(object):
+	# serves one or more networks, each with its own Project
+
+	def __init__(self, projects, logCommands):
+		self.projects = projects
+		self.logCommands = logCommands
+		self.monitors = []
+		self.monitorLock = threading.Lock()
+		self.sessions = 0
+
+	########################################
+	# MONITOR PORT
+	########################################
+
+	def addMonitor(self, connection):
+		with self.monitorLock:
+			self.monitors.append(connection)
+
+	def broadcast(self, line):
+		with self.monitorLock:
+			for connection in list(self.monitors):
+				try:
+					connection.sendall(line+"\r\n")
+				except socket.error:
+					self.monitors.remove(connection)
+
+	def lightingEvent(self, project, group, level, rampTime=None, sourceUnit=0):
+		address = project.qualify(project.network+"/56/"+str(group))
+		if rampTime != None:
+			self.broadcast("lighting ramp %s %d %d  #sourceunit=%d OID=sim sessionId=sim commandId={none}" % (address, level, rampTime, sourceUnit))
+		elif level > 0:
+			self.broadcast("lighting on %s  #sourceunit=%d OID=sim sessionId=sim commandId={none}" % (address, sourceUnit))
+		else:
+			self.broadcast("lighting off %s  #sourceunit=%d OID=sim sessionId=sim commandId={none}" % (address, sourceUnit))
+
+	def randomEvent(self):
+		# a random lighting change from a key unit, as if someone had pressed a switch
+		project = random.choice(self.projects)
+		keyUnit = project.units[-1][0]
+		group = random.choice(project.levels.keys())
+		level = random.choice([0, 255, random.randint(1, 254)])
+		with project.lock:
+			project.levels[group] = level
+		if 0 < level < 255:
+			self.lightingEvent(project, group, level, 0, keyUnit)
+		else:
+			self.lightingEvent(project, group, level, None, keyUnit)
+
+	def generateEvents(self, rate):
+		# random lighting changes at a fixed rate, as if people were walking round the building pressing switches
+		interval = 1.0 / rate
+		due = time.time()
+		while True:
+			self.randomEvent()
+			due = due + interval
+			delay = due - time.time()
+			if delay > 0:
+				time.sleep(delay)
+
+	########################################
+	# COMMAND PORT
+	########################################
+
+	def project(self, address):
+		# the project of the network an address (with or without the //project prefix) is on
+		for project in self.projects:
+			if project.unqualify(address).split("/")[0] == project.network:
+				return project
+		return None
+
+	def handle(self, command):
+		# returns the lines of the reply.  all but the last carry a - after the response code
+		fields = command.split()
+		if not fields:
+			return ["400 Syntax Error."]
+		verb = fields[0].lower()
+		if verb == "noop":
+			return ["200 OK."]
+		if verb == "net" and fields[1:2] == ["list"]:
+			lines = ["131-network="+project.network+" State=ok" for project in self.projects]
+			return lines[:-1] + [lines[-1].replace("-", " ", 1)]
+		if verb in ("dbgetxml", "tree", "get", "on", "off", "ramp", "security"):
+			# commands for an object on one of the networks, e.g. tree 254 or security status_request 254/208 1
+			address = fields[2:3] if verb == "security" else fields[1:2]
+			project = self.project(address[0]) if address else None
+			if project == None:
+				return ["401 Bad object or device ID: "+" ".join(fields[1:])]
+		if verb == "dbgetxml" and len(fields) > 1:
+			return self.dbgetxml(project, project.unqualify(fields[1]))
+		if verb == "tree":
+			return self.tree(project)
+		if verb == "get" and len(fields) > 2:
+			return self.get(project, project.unqualify(fields[1]), fields[2])
+		if verb in ("on", "off", "ramp") and len(fields) > 1:
+			return self.lighting(project, verb, fields[1:])
+		if verb == "security" and len(fields) > 3 and fields[1] == "status_request":
+			return self.securityStatus(project, fields[3])
+		if verb in ("terminateramp", "lighting", "clock"):
+			return ["200 OK."]
+		if verb == "burst" and len(fields) > 1 and fields[1].isdigit():
+			for index in range(int(fields[1])):
+				self.randomEvent()
+			return ["200 OK."]
+		return ["400 Syntax Error."]
+
+	def dbgetxml(self, project, address):
+		if address == project.network+"/56":
+			groups = [(group, "Group %d" % (group)) for group in sorted(project.levels)]
+			tagName = "Lighting"
+		elif address == project.network+"/208" and project.zones:
+			groups = [(zone, "Zone %d" % (zone)) for zone in range(1, project.zones + 1)]
+			tagName = "Security"
+		else:
+			return ["401 Bad object or device ID: "+address]
+		xml = ["<?xml version=\"1.0\" encoding=\"utf-8\"?>", "<Network>", "<Application>",
+			"<TagName>%s</TagName>" % (tagName), "<Address>%s</Address>" % (address.split("/")[1])]
+		for group, name in groups:
+			xml.append("<Group><TagName>%s</TagName><Address>%d</Address><OID>sim-%s-%d</OID></Group>" % (name, group, address.split("/")[1], group))
+		xml.extend(["</Application>", "</Network>"])
+		return ["343-Begin XML snippet"] + ["347-"+line for line in xml] + ["344 End XML snippet"]
+
+	def tree(self, project):
+		lines = []
+		for unit, unitType, groups in project.units:
+			lines.append("320-%s type=%s app=56 state=ok groups=%s" % (project.qualify(project.network+"/p/"+str(unit)), unitType, ",".join([str(group) for group in groups])))
+		for sensor in project.sensors:
+			lines.append("320-%s type=PIR5031 app=56 state=ok groups=" % (project.qualify(project.network+"/p/"+str(sensor))))
+		with project.lock:
+			levels = dict(project.levels)
+		for unit, unitType, groups in project.units[:-1]:
+			for group in groups:
+				lines.append("320-%s type=group level=%d units=%d" % (project.qualify(project.network+"/56/"+str(group)), levels[group], unit))
+		return lines + ["320 -end-"]
+
+	def get(self, project, address, parameter):
+		parameter = parameter.lower()
+		if parameter == "level" and address == project.network+"/56/*":
+			with project.lock:
+				levels = sorted(project.levels.items())
+			lines = ["300-%s: level=%d" % (project.qualify(project.network+"/56/"+str(group)), level) for group, level in levels]
+			return lines[:-1] + [lines[-1].replace("-", " ", 1)]
+		if parameter == "level" and project.group(address) != None:
+			with project.lock:
+				level = project.levels[project.group(address)]
+			return ["300 %s: level=%d" % (project.qualify(address), level)]
+		if parameter == "lightlevel" and address.split("/")[-1].isdigit() and int(address.split("/")[-1]) in project.sensors:
+			return ["300 %s: LightLevel=%d" % (project.qualify(address), random.randint(0, 2000))]
+		return ["401 Bad object or device ID: "+address]
+
+	def lighting(self, project, verb, arguments):
+		group = project.group(arguments[0])
+		if group == None:
+			return ["401 Bad object or device ID: "+arguments[0]]
+		rampTime = None
+		if verb == "on":
+			level = 255
+		elif verb == "off":
+			level = 0
+		else:
+			try:
+				level = max(0, min(255, int(arguments[1])))
+				rampTime = int(arguments[2].rstrip("s")) if len(arguments) > 2 else 0
+			except (IndexError, ValueError):
+				return ["400 Syntax Error."]
+		with project.lock:
+			project.levels[group] = level
+		self.lightingEvent(project, group, level, rampTime)
+		return ["200 OK: "+project.qualify(project.network+"/56/"+str(group))]
+
+	def securityStatus(self, project, request):
+		if not project.zones:
+			return ["401 Bad object or device ID: "+project.network+"/208"]
+		address = project.qualify(project.network+"/208")
+		if request == "1":
+			# armed state, tamper and panic followed by zones 1 to 29
+			zones = ["0"] * 29
+			self.broadcast("security status_report_1 %s 0 0 0 %s  #sourceunit=0" % (address, " ".join(zones)))
+		else:
+			zones = ["0"] * 48
+			self.broadcast("security status_report_2 %s %s  #sourceunit=0" % (address, " ".join(zones)))
+		return ["200 OK."]
+
+class CommandHandler(SocketServer.StreamRequestHandler):
+
+	tagPattern = re.compile("(\[\d+\] )?(.*)")
+
+	def handle(self):
+		simulator = self.server.simulator
+		simulator.sessions = simulator.sessions + 1
+		self.wfile.write("201 Service ready: Clipsal C-Gate Version: v4.5.11 (build 2863) #cmd-syntax=2.2\r\n")
+		for line in iter(self.rfile.readline, ""):
+			m = self.tagPattern.match(line.strip())
+			if simulator.logCommands:
+				sys.stderr.write("> %s\n" % (line.strip()))
+			tag = m.group(1) or ""
+			reply = simulator.handle(m.group(2))
+			self.wfile.write("".join([tag+line+"\r\n" for line in reply]))
+		simulator.sessions = simulator.sessions - 1
+
+class MonitorHandler(SocketServer.BaseRequestHandler):
+
+	def handle(self):
+		self.server.simulator.addMonitor(self.request)
+		# events are written by the simulator.  hold the connection open until the client goes away
+		while self.request.recv(1024):
+			pass
+
+class Server(SocketServer.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def handle_error(self, request, clientAddress):
+		# clients going away part way through a reply is expected
+		if not isinstance(sys.exc_info()[1], socket.error):
+			SocketServer.ThreadingTCPServer.handle_error(self, request, clientAddress)
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--bind", default="0.0.0.0", help="address to listen on")
+	parser.add_option("--command-port", type="int", default=20023)
+	parser.add_option("--monitor-port", type="int", default=20025)
+	parser.add_option("--project", default="HOME", help="c-bus project name")
+	parser.add_option("--networks", "--network", dest="networks", default="254", help="comma separated c-bus network numbers")
+	parser.add_option("--groups", type="int", default=50, help="number of lighting groups")
+	parser.add_option("--zones", type="int", default=0, help="number of security zones (0 disables application 208)")
+	parser.add_option("--sensors", type="int", default=0, help="number of light sensor units")
+	parser.add_option("--event-rate", type="float", default=0, help="random lighting events per second")
+	parser.add_option("--log-commands", action="store_true", default=False, help="print each command received")
+	options, arguments = parser.parse_args()
+
+	networks = options.networks.split(",")
+	simulator = Simulator([Project(options.project, network, options.groups, min(options.zones, 80), options.sensors) for network in networks], options.log_commands)
+	for port, handler in [(options.command_port, CommandHandler), (options.monitor_port, MonitorHandler)]:
+		server = Server((options.bind, port), handler)
+		server.simulator = simulator
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+	sys.stderr.write("simulating c-gate for project %s network %s with %d groups on ports %d and %d\n" % (options.project, ", ".join(networks), options.groups, options.command_port, options.monitor_port))
+	if options.event_rate > 0:
+		events = threading.Thread(target=simulator.generateEvents, args=(options.event_rate,))
+		events.daemon = True
+		events.start()
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main()
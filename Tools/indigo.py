@@ -0,0 +1,232 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+# a stand-in for the indigo module so the plugin can be run outside indigo by the tools in this folder.  it provides
+# the parts of the indigo api the plugin uses and keeps devices, triggers and broadcasts in memory.
+#
+#   import indigo
+#   plugin = indigo.loadPlugin()
+#   cbus = plugin.Plugin("uk.co.l1fe.indigoplugin.C-Bus", "C-Bus", "1.0", {"cgateNetworkLocation": "127.0.0.1"})
+#
+# every call which would be a round trip to the indigo server waits for ipcLatency seconds so a slow server can be
+# simulated
+#
+
+import os
+import sys
+import imp
+import time
+import logging
+import tempfile
+import itertools
+import threading
+import collections
+
+ipcLatency = 0
+
+def ipc():
+	if ipcLatency > 0:
+		time.sleep(ipcLatency)
+
+class Dict(dict):
+	pass
+
+class List(list):
+	pass
+
+class kProtocol:
+	Plugin = "Plugin"
+
+class kStateImageSel:
+	SensorOn = "SensorOn"
+	SensorTripped = "SensorTripped"
+
+class kDeviceAction:
+	TurnOn = "TurnOn"
+	TurnOff = "TurnOff"
+	Toggle = "Toggle"
+	SetBrightness = "SetBrightness"
+	BrightenBy = "BrightenBy"
+	DimBy = "DimBy"
+	RequestStatus = "RequestStatus"
+
+class PluginBase(object):
+
+	class StopThread(Exception):
+		pass
+
+	def __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):
+		self.pluginId = pluginId
+		self.pluginDisplayName = pluginDisplayName
+		self.pluginVersion = pluginVersion
+		self.pluginPrefs = pluginPrefs
+		self.logger = logging.getLogger("Plugin")
+		self.stopThread = False
+
+	def __del__(self):
+		pass
+
+	def sleep(self, seconds):
+		# as in indigo, a plugin which is stopping is woken with StopThread
+		deadline = time.time() + seconds
+		while time.time() < deadline:
+			if self.stopThread:
+				raise self.StopThread
+			time.sleep(min(0.1, max(0, deadline - time.time())))
+
+	def deviceCreated(self, dev):
+		pass
+
+	def deviceUpdated(self, origDev, newDev):
+		pass
+
+	def deviceDeleted(self, dev):
+		pass
+
+class Device(object):
+
+	def __init__(self, id, name, address, description, pluginId, deviceTypeId, props):
+		self.id = id
+		self.name = name
+		self.address = address
+		self.description = description
+		self.pluginId = pluginId
+		self.deviceTypeId = deviceTypeId
+		self.pluginProps = Dict(props or {})
+		self.supportsOnState = True
+		self.image = None
+		self.states = Dict({'onOffState': False})
+		if deviceTypeId == "cbusDimmer":
+			self.states['brightnessLevel'] = 0
+		elif deviceTypeId == "cbusLightSensor":
+			self.states['sensorValue'] = 0
+
+	@property
+	def onState(self):
+		return self.states.get('onOffState')
+
+	@property
+	def brightness(self):
+		return self.states.get('brightnessLevel', 0)
+
+	def updateStateOnServer(self, key, value=None, uiValue=None):
+		ipc()
+		self.states[key] = value
+
+	def updateStatesOnServer(self, keyValueList):
+		ipc()
+		for item in keyValueList:
+			self.states[item['key']] = item['value']
+
+	def updateStateImageOnServer(self, image):
+		ipc()
+		self.image = image
+
+class DeviceCollection(object):
+	# indigo.devices.  devices are found by id or by name
+
+	def __init__(self):
+		self.devices = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def __getitem__(self, key):
+		ipc()
+		if isinstance(key, (int, long)):
+			return self.devices[key]
+		for dev in self.devices.values():
+			if dev.name == key:
+				return dev
+		raise KeyError(key)
+
+	def __len__(self):
+		return len(self.devices)
+
+	def iter(self, filter=""):
+		ipc()
+		for dev in list(self.devices.values()):
+			if filter in ("", "self") or filter == "self."+dev.deviceTypeId:
+				yield dev
+
+	def add(self, dev):
+		with self.lock:
+			self.devices[dev.id] = dev
+
+	def remove(self, dev):
+		with self.lock:
+			self.devices.pop(dev.id, None)
+
+class DeviceCommands(object):
+	# indigo.device
+
+	def __init__(self):
+		self.ids = itertools.count(100000001)
+
+	def create(self, protocol=None, address="", name="", description="", pluginId="", deviceTypeId="", props=None):
+		ipc()
+		dev = Device(next(self.ids), name, address, description, pluginId, deviceTypeId, props)
+		devices.add(dev)
+		return dev
+
+	def changeDeviceTypeId(self, dev, deviceTypeId):
+		ipc()
+		dev.deviceTypeId = deviceTypeId
+		return dev
+
+	def delete(self, dev):
+		ipc()
+		devices.remove(dev)
+
+class TriggerCommands(object):
+	# indigo.trigger.  executed triggers are counted by id
+
+	def __init__(self):
+		self.executed = collections.Counter()
+
+	def execute(self, trigger):
+		ipc()
+		self.executed[getattr(trigger, "id", trigger)] += 1
+
+class Server(object):
+	# indigo.server.  broadcasts are counted by message type
+
+	def __init__(self):
+		self.broadcasts = collections.Counter()
+		self.installFolder = None
+
+	def broadcastToSubscribers(self, messageType, message):
+		ipc()
+		self.broadcasts[messageType] += 1
+
+	def getInstallFolderPath(self):
+		# the project cache and traffic recordings are written to Preferences/Plugins in a temporary folder
+		if self.installFolder == None:
+			self.installFolder = tempfile.mkdtemp(prefix="indigo")
+			os.makedirs(os.path.join(self.installFolder, "Preferences", "Plugins"))
+		return self.installFolder
+
+	def log(self, message, type=None, isError=False):
+		logging.getLogger("Indigo").info(message)
+
+devices = DeviceCollection()
+device = DeviceCommands()
+trigger = TriggerCommands()
+server = Server()
+
+def reset():
+	# forget every device, trigger and broadcast.  the install folder (and so the project cache) is kept
+	global devices, trigger
+	devices = DeviceCollection()
+	trigger = TriggerCommands()
+	server.broadcasts.clear()
+
+def loadPlugin(path=None):
+	# returns plugin.py as a module.  inside indigo the plugin host provides indigo as a global so it is set up the
+	# same way here
+	if path == None:
+		path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Contents", "Server Plugin", "plugin.py")
+	module = imp.new_module("plugin")
+	module.__file__ = path
+	module.indigo = sys.modules[__name__]
+	sys.modules["plugin"] = module
+	execfile(path, module.__dict__)
+	return module
@@ -0,0 +1,116 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+# replays the monitor traffic in a trace recorded from the plugin menu (Start Recording C-Gate Traffic) through the
+# plugin's own parsing and dispatch, offline against indigo.py.  each lighting group, security zone and measurement
+# channel in the trace is given a stub device so the handlers update devices, fire triggers and broadcast as they
+# would in indigo, without going anywhere near a real indigo install.
+#
+#   python replay_trace.py uk.co.l1fe.indigoplugin.C-Bus.20190301-201500.trace.gz
+#   python replay_trace.py --realtime --ipc-latency 2 storm.trace.gz
+#
+# once every event has been handled the numbers of lines fed, events dispatched, handled and merged and the handling
+# rate are printed.  if the trace was recorded from startup, the units in c-gate's reply to tree are used to tell
+# manual changes from the others
+#
+
+import os
+import sys
+import time
+import gzip
+import logging
+import optparse
+
+import indigo
+
+pluginId = "uk.co.l1fe.indigoplugin.C-Bus"
+
+def readProject(plugin, path):
+	# the devices, networks and units the trace refers to
+	addresses = {}
+	units = {}
+	with gzip.open(path, "rb") as trace:
+		for entry in trace:
+			fields = entry.rstrip("\r\n").split("\t", 2)
+			if len(fields) < 3:
+				continue
+			if fields[1] == "r":
+				m = plugin.treeUnitPattern.search(fields[2])
+				if m:
+					unitType = "unknown"
+					for prefix, deviceType in plugin.treeUnitTypes:
+						if m.group(3).startswith(prefix):
+							unitType = deviceType
+					units[m.group(2)] = {'unit': unitType, 'groups': m.group(4).split(',')}
+			elif fields[1] == "m":
+				try:
+					event = plugin.parseMonitorLine(fields[2])
+				except (IndexError, ValueError):
+					continue
+				if event and event.application in ("lighting", "security", "measurement"):
+					addresses[event.address] = event.application
+	return (addresses, units)
+
+def createDevices(addresses):
+	for address, application in sorted(addresses.items()):
+		fields = address.split("/")
+		if application == "lighting":
+			indigo.device.create(address=address, name=address, pluginId=pluginId, deviceTypeId="cbusDimmer",
+				props={"unqualifiedAddress": fields[-1]})
+		elif application == "security":
+			indigo.device.create(address=address, name=address, pluginId=pluginId,
+				deviceTypeId="cbusSecurityZone" if len(fields) > 2 else "cbusSecurityAlarmPanel")
+		elif application == "measurement":
+			indigo.device.create(address=address, name=address, pluginId=pluginId, deviceTypeId="cbusLightSensor",
+				props={"measurementAddress": address})
+
+def main():
+	parser = optparse.OptionParser(usage="%prog [options] trace")
+	parser.add_option("--realtime", action="store_true", default=False, help="replay with the spacing the trace was recorded with")
+	parser.add_option("--ipc-latency", dest="ipcLatency", type="float", default=0, help="milliseconds added to each indigo server call")
+	parser.add_option("--metrics", action="store_true", default=False, help="print the plugin's performance metrics afterwards")
+	parser.add_option("--verbose", action="store_true", default=False, help="log everything the plugin logs")
+	options, arguments = parser.parse_args()
+	if len(arguments) != 1:
+		parser.error("a trace file is required")
+	logging.basicConfig(level=logging.DEBUG if options.verbose else logging.WARNING, format="%(levelname)s %(message)s")
+
+	plugin = indigo.loadPlugin()
+	addresses, units = readProject(plugin, arguments[0])
+	networks = sorted(set([address.split("/")[0] for address in addresses])) or ["254"]
+	createDevices(addresses)
+	cbus = plugin.Plugin(pluginId, "C-Bus", "replay", {"cbusNetwork": ",".join(networks)})
+	for network in cbus.networks.values():
+		network.unitMap = units
+	# everything startup() does apart from connecting to c-gate
+	cbus.dispatcher = plugin.EventDispatcher(cbus.eventWorkers, cbus.eventQueueDepth, cbus.logger, cbus.metrics)
+	cbus.scheduler = plugin.Scheduler(cbus.logger)
+	cbus.buildDeviceAddressMap()
+	print "replaying %s with %d devices on network %s" % (arguments[0], len(indigo.devices), ", ".join(networks))
+
+	indigo.ipcLatency = options.ipcLatency / 1000.0
+	cbus.metrics.reset()
+	started = time.time()
+	# the same path monitorNetwork takes for each line read from c-gate
+	fed = plugin.replayTrace(arguments[0], cbus.processMonitorLine, options.realtime)
+	while True:
+		stats = cbus.dispatcher.stats()
+		if stats['depth'] == 0 and stats['handled'] + stats['merged'] == stats['dispatched']:
+			break
+		time.sleep(0.01)
+	elapsed = max(time.time() - started, 0.001)
+
+	print "%d monitor lines fed and handled in %.2f seconds" % (fed, elapsed)
+	print "%d events dispatched, %d handled, %d merged whilst the queue was full" % (stats['dispatched'], stats['handled'], stats['merged'])
+	print "monitoring paused %d times for room in the queue, largest queue %d" % (stats['blocked'], stats['maxDepth'])
+	print "%.0f events handled per second" % ((stats['handled'] + stats['merged']) / elapsed)
+	print "%d broadcasts, %d triggers executed" % (sum(indigo.server.broadcasts.values()), sum(indigo.trigger.executed.values()))
+	if options.metrics:
+		for line in cbus.metrics.report():
+			print line
+	# the plugin's daemon threads are left running so leave without tearing them down
+	sys.stdout.flush()
+	os._exit(0)
+
+if __name__ == "__main__":
+	main()
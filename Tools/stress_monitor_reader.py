@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+# stress test of the plugin's monitor port reader (LineSocket) against a local socket.  monitor lines are written
+# in random fragments (down to single bytes, splitting \r\n pairs), in large bursts and with random pauses, and every
+# line must come back whole, in order and exactly once.  it also checks that a line written after a quiet spell is
+# returned straight away rather than on the next poll, and that c-gate closing the socket mid line raises EOFError
+# without handing back the partial line.
+#
+#   python stress_monitor_reader.py
+#   python stress_monitor_reader.py --lines 200000 --seed 7
+#
+# the exit status is 1 if any check fails
+#
+
+import sys
+import time
+import random
+import socket
+import optparse
+import threading
+
+import indigo
+
+def monitorLines(count, generator):
+	# lines like those c-gate writes to the monitor port, with the occasional very long one
+	lines = []
+	for index in range(count):
+		group = generator.randint(1, 255)
+		kind = generator.random()
+		if kind < 0.4:
+			line = "lighting on //HOME/254/56/%d  #sourceunit=%d OID=%08x sessionId=cmd%d commandId={none}" % (group, generator.randint(0, 255), index, index)
+		elif kind < 0.8:
+			line = "lighting ramp //HOME/254/56/%d %d %d  #sourceunit=%d OID=%08x" % (group, generator.randint(0, 255), generator.choice([0, 4, 8]), generator.randint(0, 255), index)
+		elif kind < 0.99:
+			line = "security zone_unsealed //HOME/254/208/%d  #sourceunit=%d" % (generator.randint(1, 80), generator.randint(0, 255))
+		else:
+			line = "security status_report_2 //HOME/254/208 " + " ".join(["0"] * generator.randint(48, 4000))
+		lines.append(line)
+	return lines
+
+class Feeder(object):
+	# the c-gate end of the connection
+
+	def __init__(self):
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.bind(("127.0.0.1", 0))
+		self.listener.listen(1)
+		self.port = self.listener.getsockname()[1]
+		self.connection = None
+		self.accepted = threading.Event()
+		accept = threading.Thread(target=self.accept)
+		accept.daemon = True
+		accept.start()
+
+	def accept(self):
+		self.connection, address = self.listener.accept()
+		self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.accepted.set()
+
+	def fragmented(self, data, generator):
+		position = 0
+		while position < len(data):
+			kind = generator.random()
+			if kind < 0.6:
+				size = generator.randint(1, 16)
+			elif kind < 0.95:
+				size = generator.randint(17, 4096)
+			else:
+				# a burst
+				size = generator.randint(65536, 262144)
+			self.connection.sendall(data[position:position + size])
+			position = position + size
+			if generator.random() < 0.01:
+				time.sleep(generator.random() * 0.01)
+
+	def close(self):
+		self.connection.close()
+		self.listener.close()
+
+def collect(reader, expected, timeout):
+	received = []
+	deadline = time.time() + timeout
+	while len(received) < expected and time.time() < deadline:
+		received.extend(reader.readLines(1))
+	return received
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--lines", type="int", default=50000, help="monitor lines to send")
+	parser.add_option("--seed", type="int", default=int(time.time()), help="seed for the fragmentation, to repeat a failure")
+	options, arguments = parser.parse_args()
+	generator = random.Random(options.seed)
+	plugin = indigo.loadPlugin()
+	failures = []
+
+	feeder = Feeder()
+	reader = plugin.LineSocket("127.0.0.1", feeder.port)
+	feeder.accepted.wait(5)
+	lines = monitorLines(options.lines, generator)
+	data = "".join([line+"\r\n" for line in lines])
+	send = threading.Thread(target=feeder.fragmented, args=(data, generator))
+	send.daemon = True
+	started = time.time()
+	send.start()
+	received = collect(reader, len(lines), 120)
+	elapsed = time.time() - started
+	if received != lines:
+		mismatch = [index for index in range(min(len(received), len(lines))) if received[index] != lines[index]]
+		failures.append("fragmented lines: %d sent, %d received, first difference at line %s" % (len(lines), len(received), mismatch[0] if mismatch else min(len(received), len(lines))))
+	print "%d lines (%d bytes) received whole in %.2f seconds (%.0f lines/s)" % (len(received), len(data), elapsed, len(received) / elapsed)
+
+	# a line after a quiet spell must be returned as soon as it arrives, not on the next poll
+	delays = []
+	for index in range(20):
+		time.sleep(0.05)
+		sent = time.time()
+		feeder.connection.sendall("lighting off //HOME/254/56/1  #sourceunit=1\r\n")
+		if reader.readLines(1) != ["lighting off //HOME/254/56/1  #sourceunit=1"]:
+			failures.append("quiet spell: line not returned whole")
+			break
+		delays.append(time.time() - sent)
+	if delays:
+		worst = max(delays)
+		print "line after a quiet spell returned within %.2fms (worst of %d)" % (1000 * worst, len(delays))
+		if worst > 0.1:
+			failures.append("quiet spell: line took %.0fms to be returned" % (1000 * worst))
+
+	# c-gate going away part way through a line
+	feeder.connection.sendall("lighting on //HOME/254/56/2  #sourceunit=1\r\nlighting on //HOME/25")
+	feeder.close()
+	closing = []
+	try:
+		while True:
+			closing.extend(reader.readLines(1))
+	except EOFError:
+		pass
+	if closing != ["lighting on //HOME/254/56/2  #sourceunit=1"]:
+		failures.append("closed socket: received %r" % (closing))
+	reader.close()
+
+	for failure in failures:
+		print "FAILED %s (seed %d)" % (failure, options.seed)
+	if not failures:
+		print "passed (seed %d)" % (options.seed)
+	return 1 if failures else 0
+
+if __name__ == "__main__":
+	sys.exit(main())